@@ -0,0 +1,232 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models.sql.datastructures import EmptyResultSet
+import warnings
+
+
+class IndexWarning(UserWarning):
+    pass
+
+
+def _sqlite(cursor, sql, params):
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    plan = [row[-1] for row in cursor.fetchall()]
+    problems = []
+    for line in plan:
+        if 'TEMP B-TREE' in line:
+            problems.append('sort: {0}'.format(line))
+        elif line.startswith('SCAN') and 'INDEX' not in line:
+            problems.append('full scan: {0}'.format(line))
+    return plan, problems
+
+
+def _postgresql(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    plan = [row[0] for row in cursor.fetchall()]
+    problems = []
+    for line in plan:
+        node = line.strip().lstrip('->').strip()
+        if node.startswith(('Sort', 'Incremental Sort')):
+            problems.append('sort: {0}'.format(node))
+        elif node.startswith('Seq Scan'):
+            problems.append('full scan: {0}'.format(node))
+    return plan, problems
+
+
+def _mysql(cursor, sql, params):
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [c[0].lower() for c in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    plan = [' '.join('{0}={1}'.format(k, v) for k, v in sorted(row.items()))
+            for row in rows]
+    problems = []
+    for row in rows:
+        if 'filesort' in (row.get('extra') or ''):
+            problems.append('sort: {0} {1}'.format(row.get('table'),
+                                                   row['extra']))
+        if row.get('type') == 'ALL':
+            problems.append('full scan: {0}'.format(row.get('table')))
+    return plan, problems
+
+
+_explainers = {
+    'mysql': _mysql,
+    'postgresql': _postgresql,
+    'sqlite': _sqlite,
+}
+
+
+class IndexAdvice(object):
+    '''The results of checking a paginator's queries. plans has the EXPLAIN
+    output for the forward and reverse queries, problems anything in them that
+    suggests the ordering isn't being served by an index, and index the
+    CREATE INDEX that should fix it, if there's one that can.'''
+
+    def __init__(self, plans, problems, index):
+        self.plans = plans
+        self.problems = problems
+        self.index = index
+
+    def __repr__(self):
+        return '<IndexAdvice (%s, %s)>' % (self.problems, self.index)
+
+    def __str__(self):
+        if not self.problems:
+            return 'ok'
+        lines = ['{0}: {1}'.format(direction, problem)
+                 for direction, problem in self.problems]
+        if self.index:
+            lines.append('try: {0}'.format(self.index))
+        return '\n'.join(lines)
+
+
+def _equality_columns(queryset):
+    # the columns of the main table that the queryset filters on with =,
+    # which need to come before the ordering in the index. anything OR'd,
+    # negated, or on other tables is left out
+    query = queryset.query
+    alias = query.get_initial_alias()
+    columns = []
+
+    def walk(node):
+        if getattr(node, 'negated', False) or \
+                (len(node.children) > 1 and node.connector != 'AND'):
+            return
+        for child in node.children:
+            if hasattr(child, 'children'):
+                walk(child)
+                continue
+            if isinstance(child, tuple):
+                # (Constraint, lookup_type, annotation, value)
+                constraint, lookup = child[0], child[1]
+                child_alias = getattr(constraint, 'alias', None)
+                column = getattr(constraint, 'col', None)
+            else:
+                lookup = getattr(child, 'lookup_name', None)
+                target = getattr(child, 'lhs', None)
+                child_alias = getattr(target, 'alias', None)
+                column = getattr(getattr(target, 'target', None), 'column',
+                                 None)
+            if lookup == 'exact' and child_alias == alias and column and \
+                    column not in columns:
+                columns.append(column)
+
+    walk(query.where)
+    return columns
+
+
+def _suggest_index(paginator):
+    queryset = paginator.queryset
+    meta = queryset.model._meta
+    ordering = []
+    for (field, descending), key_field in zip(paginator._keys,
+                                              paginator._key_fields):
+        if '__' in field:
+            # ordering across a relationship can't be served by an index on
+            # the main table
+            return None
+        ordering.append((key_field.column, descending))
+
+    equality = [c for c in _equality_columns(queryset)
+                if c not in [o for o, _ in ordering]]
+    # an index can be walked in either direction, so it only needs to spell
+    # out the directions when they're mixed
+    mixed = len(set(d for _, d in ordering)) > 1
+    columns = equality + ['{0} DESC'.format(c) if mixed and d else c
+                          for c, d in ordering]
+    name = '{0}_{1}_pp'.format(meta.db_table, '_'.join(
+        c.split()[0] for c in columns))
+    return 'CREATE INDEX {0} ON {1} ({2});'.format(name, meta.db_table,
+                                                   ', '.join(columns))
+
+
+def advise(paginator):
+    '''EXPLAINs the queries paginator will run for the first page and then
+    seeking forward and backward from a token and checks them for sorts and
+    full table scans. Returns an IndexAdvice or None if the database isn't one
+    we know how to check.
+
+    The token is made from the first object in the queryset so that'll be
+    fetched, if there isn't one only the first page's query is checked.'''
+    queryset = paginator.queryset
+    connection = connections[queryset.db]
+    explainer = _explainers.get(connection.vendor)
+    if explainer is None:
+        return None
+
+    limit = paginator.per_page + 1
+    first = queryset.order_by(*paginator._orderings)
+    queries = [('first', first[:limit])]
+    for obj in first[:1]:
+        values = paginator._object_to_values(obj)
+        queries.append(('forward', first.filter(
+            paginator._values_to_clause(values))[:limit]))
+        queries.append(('reverse', queryset.filter(
+            paginator._values_to_clause(values, rev=True))
+            .order_by(*paginator._reverse_orderings)[:limit]))
+
+    plans = {}
+    problems = []
+    cursor = connection.cursor()
+    try:
+        for direction, qs in queries:
+            try:
+                sql, params = qs.query.get_compiler(qs.db).as_sql()
+            except EmptyResultSet:
+                # e.g. filter(pk__in=[]), it'll never hit the database
+                continue
+            plans[direction], found = explainer(cursor, sql, params)
+            if direction == 'first':
+                # walking the table, or an index, in order is what we want
+                # so long as there's no sort, it'll stop at the limit
+                found = [p for p in found if not p.startswith('full scan')]
+            problems.extend((direction, p) for p in found)
+    finally:
+        cursor.close()
+
+    return IndexAdvice(plans, problems,
+                       _suggest_index(paginator) if problems else None)
+
+
+_checked = set()
+
+
+def warn_if_unindexed(paginator):
+    '''Warns, with an IndexWarning, if paginator's ordering doesn't look to be
+    served by an index. Used by PerformantPaginator when DEBUG and the
+    PERFORMANT_PAGINATION_CHECK_INDEXES setting are on, each model, ordering,
+    and shape of where clause is only checked once.'''
+    queryset = paginator.queryset
+    try:
+        # the sql without its params, so that the same query for every user,
+        # tenant, etc. is only checked the once
+        sql, _ = queryset.query.get_compiler(queryset.db).as_sql()
+        key = (queryset.db, sql, paginator._orderings)
+        if key in _checked:
+            return
+        _checked.add(key)
+        # in a savepoint, a failure would otherwise abort the caller's
+        # transaction on PostgreSQL
+        with transaction.atomic(using=queryset.db):
+            advice = advise(paginator)
+    except (DatabaseError, EmptyResultSet):
+        # not something we should get in the way of, tables may not exist yet,
+        # the queryset may not be able to match anything, etc.
+        return
+    if advice and advice.problems:
+        meta = queryset.model._meta
+        warnings.warn('{0}.{1} ordered by {2} may not be using an index\n{3}'
+                      .format(meta.app_label, meta.object_name,
+                              ','.join(paginator._orderings), advice),
+                      IndexWarning, stacklevel=3)
+
+
+def checking_enabled():
+    return settings.DEBUG and \
+        getattr(settings, 'PERFORMANT_PAGINATION_CHECK_INDEXES', False)
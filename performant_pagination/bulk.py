@@ -0,0 +1,103 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import transaction
+from performant_pagination.pagination import PerformantPaginator
+from time import sleep, time
+
+
+def _batched(queryset, ordering, batch_size, target_time, max_batch_size,
+             pause, progress, apply):
+    batch_size = int(batch_size)
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+    max_batch_size = int(max_batch_size or batch_size * 10)
+
+    paginator = PerformantPaginator(queryset, ordering=ordering)
+    # just the keys, with the pk up front to pick the batch out by
+    keys = queryset.order_by(*paginator._orderings) \
+        .values_list('pk', *paginator._fields)
+    values = None
+    total = 0
+    while True:
+        start = time()
+        with transaction.atomic(using=queryset.db):
+            seek = keys
+            if values is not None:
+                seek = keys.filter(paginator._values_to_clause(values))
+            rows = list(seek[:batch_size])
+            if rows:
+                total += apply(queryset.filter(pk__in=[row[0]
+                                                       for row in rows]),
+                               len(rows))
+        elapsed = time() - start
+
+        if progress:
+            progress(total)
+        if len(rows) < batch_size:
+            # a short (or empty) batch means we've run out
+            return total
+        values = list(rows[-1][1:])
+
+        if target_time and elapsed > 0:
+            # head towards target_time, but no more than halving or doubling
+            # at a time so that one slow batch doesn't throw things off
+            batch_size = int(min(max(batch_size * target_time / elapsed,
+                                     batch_size / 2, 1),
+                                 batch_size * 2, max_batch_size))
+        if pause:
+            # let replication, and everyone else, catch up
+            sleep(pause)
+
+
+def batched_update(queryset, ordering='pk', batch_size=1000, target_time=None,
+                   max_batch_size=None, pause=0, progress=None, **changes):
+    '''queryset.update(**changes), but a batch_size rows at a time, walking
+    ordering the way PerformantPaginator would, so that each batch is a short
+    transaction, holding a few locks for a little while, rather than one huge
+    one. Returns the number of rows updated.
+
+    Each batch is a seek for the keys of the next batch_size rows and an
+    update of them by pk, in their own transaction. With target_time the
+    batch size is adjusted, up to max_batch_size (default 10 * batch_size),
+    so that each transaction takes about that many seconds. pause sleeps for
+    that many seconds between batches and progress, if given, is called
+    with the running total after each.
+
+    The changes can't include the ordering's fields, or the relationships
+    they're reached through, the rows would move under the walk.'''
+    paginator = PerformantPaginator(queryset, ordering=ordering)
+    meta = queryset.model._meta
+    touched = set()
+    for field in paginator._fields:
+        # the field itself or the relationship that leads to it
+        name = field.split('__')[0]
+        field = meta.pk if name == 'pk' else meta.get_field(name)
+        if set(changes) & set((name, field.name, field.attname)):
+            touched.add(name)
+    if touched:
+        raise ValueError('the ordering field(s) {0} can not be changed'
+                         .format(', '.join(sorted(touched))))
+
+    def apply(batch, n):
+        return batch.update(**changes)
+
+    return _batched(queryset, ordering, batch_size, target_time,
+                    max_batch_size, pause, progress, apply)
+
+
+def batched_delete(queryset, ordering='pk', batch_size=1000, target_time=None,
+                   max_batch_size=None, pause=0, progress=None):
+    '''queryset.delete(), but a batch_size rows at a time, see
+    batched_update. Returns the number of rows deleted, not counting any
+    cascades.'''
+
+    def apply(batch, n):
+        batch.delete()
+        return n
+
+    return _batched(queryset, ordering, batch_size, target_time,
+                    max_batch_size, pause, progress, apply)
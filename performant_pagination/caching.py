@@ -0,0 +1,274 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import OrderedDict
+from django.core.cache import get_cache
+from django.db.models.query import ValuesQuerySet
+from django.db.models.signals import post_delete, post_save
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils.six.moves import cPickle as pickle
+from hashlib import sha1
+from threading import Lock
+from time import time
+from uuid import uuid4
+
+
+def queryset_fingerprint(queryset):
+    '''Returns a hash of the SQL, and params, that queryset will run.'''
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        # e.g. filter(pk__in=[]) or none(), there's no SQL, and no rows, so
+        # they're all the same
+        sql, params = 'empty', ()
+    return sha1('{0}:{1}:{2}'.format(queryset.db, sql, params)
+                .encode('utf-8')).hexdigest()
+
+
+def codec_fingerprint(codec):
+    '''Returns a hash of codec's type and settings, e.g. a BinaryTokenCodec's
+    secret and digest_size, tokens from differently set up codecs aren't
+    interchangeable.'''
+    settings = sorted(vars(codec).items())
+    return sha1('{0}.{1}:{2}'.format(type(codec).__module__,
+                                     type(codec).__name__, settings)
+                .encode('utf-8')).hexdigest()
+
+
+class LRUCache(object):
+    '''A small, in-process, least recently used cache that implements the
+    bits of Django's cache API we need. Values are pickled and once they add
+    up to more than max_size bytes the least recently used are evicted.
+
+    It's thread-safe, but being in-process invalidation will only see saves
+    and deletes made by the process itself.'''
+
+    def __init__(self, max_size=16 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        # key -> (pickled, expires), least recently used first
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time():
+            self.size -= len(entry[0])
+            return None
+        # back on the end as the most recently used
+        self._entries[key] = entry
+        return entry
+
+    def _set(self, key, value, timeout):
+        self._delete(key)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(pickled) > self.max_size:
+            # it'd never fit
+            return
+        self._entries[key] = (pickled, time() + timeout if timeout else None)
+        self.size += len(pickled)
+        while self.size > self.max_size:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get(key)
+        return default if entry is None else pickle.loads(entry[0])
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class ModelVersions(object):
+    '''Versions, kept in the cache, for models that change whenever one of
+    their objects is saved or deleted. Including a model's version in a cache
+    key invalidates everything cached about it in one go.
+
+    Versions are random rather than counters so that if one is evicted nothing
+    cached under an earlier one can come back.
+
+    Only changes that fire post_save or post_delete are seen, i.e. not
+    QuerySet.update or bulk_create.'''
+
+    timeout = 60 * 60 * 24 * 30
+
+    def __init__(self, cache, prefix):
+        self.cache = cache
+        self.prefix = prefix
+        self._watching = set()
+        # never reused, unlike id(self), so a receiver left behind by one
+        # that's been collected can't be mistaken for ours
+        self._uid = uuid4().hex
+
+    def _key(self, model):
+        meta = model._meta
+        return '{0}:version:{1}.{2}'.format(self.prefix, meta.app_label,
+                                            meta.object_name)
+
+    def get(self, model):
+        self.watch(model)
+        key = self._key(model)
+        version = self.cache.get(key)
+        if version is None:
+            # first time, or it's been evicted. if someone beats us to it
+            # we'll use theirs
+            self.cache.add(key, uuid4().hex, self.timeout)
+            version = self.cache.get(key)
+        return version
+
+    def bump(self, model):
+        self.cache.set(self._key(model), uuid4().hex, self.timeout)
+
+    def _changed(self, sender, **kwargs):
+        self.bump(sender)
+
+    def watch(self, model):
+        if model in self._watching:
+            return
+        self._watching.add(model)
+        # weakly, so that we don't outlive our owner
+        post_save.connect(self._changed, sender=model,
+                          dispatch_uid=self._uid)
+        post_delete.connect(self._changed, sender=model,
+                            dispatch_uid=self._uid)
+
+
+class CountCache(object):
+    '''Caches the counts of querysets, keyed by a fingerprint of their SQL,
+    for timeout seconds.
+
+    Once an entry has expired it will be served stale for up to stale_timeout
+    more seconds while the first caller to see it recounts, so that only one
+    count runs at a time.
+
+    With invalidate (the default) counts are thrown away whenever an object
+    of the queryset's model is saved or deleted, see ModelVersions.
+
+    cache_alias is the Django cache to use.'''
+
+    def __init__(self, timeout=300, stale_timeout=0, invalidate=True,
+                 cache_alias='default', prefix='performant_pagination'):
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.cache = get_cache(cache_alias)
+        self.prefix = prefix
+        self.versions = ModelVersions(self.cache, prefix) if invalidate \
+            else None
+
+    def _key(self, queryset):
+        version = self.versions.get(queryset.model) if self.versions else ''
+        return '{0}:count:{1}:{2}'.format(self.prefix,
+                                          queryset_fingerprint(queryset),
+                                          version)
+
+    def count(self, queryset):
+        key = self._key(queryset)
+        lock = key + ':lock'
+        entry = self.cache.get(key)
+        if entry is not None:
+            count, fresh_until = entry
+            if time() < fresh_until:
+                return count
+            # it's stale, if someone else is already recounting we'll make do
+            # with what we have
+            if not self.cache.add(lock, 1, self.stale_timeout or self.timeout):
+                return count
+
+        try:
+            count = queryset.count()
+            self.cache.set(key, (count, time() + self.timeout),
+                           self.timeout + self.stale_timeout)
+        finally:
+            if entry is not None:
+                self.cache.delete(lock)
+        return count
+
+
+class PageCache(object):
+    '''Caches pages, their objects and previous and next tokens, keyed by a
+    fingerprint of the paginator's queryset, its ordering, per_page, codec,
+    and the token, for timeout seconds.
+
+    backend may be a Django cache or an LRUCache, by default it's Django's
+    default cache.
+
+    With refetch only the primary keys of the objects are cached and they're
+    fetched with a single in_bulk query, cheaper than the keyset query and
+    always fresh. It doesn't apply to values() querysets, whose rows are
+    cached as they are.
+
+    With invalidate (the default) pages are thrown away whenever an object of
+    the queryset's model is saved or deleted, see ModelVersions.'''
+
+    def __init__(self, timeout=60, backend=None, refetch=False,
+                 invalidate=True, prefix='performant_pagination'):
+        self.timeout = timeout
+        self.cache = backend if backend is not None else \
+            get_cache('default')
+        self.refetch = refetch
+        self.prefix = prefix
+        self.versions = ModelVersions(self.cache, prefix) if invalidate \
+            else None
+
+    def _key(self, paginator, token):
+        queryset = paginator.queryset
+        version = self.versions.get(queryset.model) if self.versions else ''
+        # hashed, tokens can be long and some caches limit key lengths
+        key = '{0}:{1}:{2}:{3}:{4}'.format(
+            paginator._queryset_fingerprint(), paginator._orderings,
+            paginator.per_page, codec_fingerprint(paginator.codec),
+            token or '')
+        return '{0}:page:{1}:{2}'.format(
+            self.prefix, sha1(key.encode('utf-8')).hexdigest(), version)
+
+    def _refetching(self, paginator):
+        return self.refetch and \
+            not isinstance(paginator.queryset, ValuesQuerySet)
+
+    def get(self, paginator, token):
+        '''Returns the object list, previous, and next tokens for token or
+        None if they're not cached.'''
+        entry = self.cache.get(self._key(paginator, token))
+        if entry is None or not self._refetching(paginator):
+            return entry
+        pks, previous_token, next_token = entry
+        objects = paginator.queryset.in_bulk(pks)
+        if len(objects) != len(pks):
+            # something's gone missing, start over
+            return None
+        return [objects[pk] for pk in pks], previous_token, next_token
+
+    def set(self, paginator, token, object_list, previous_token, next_token):
+        if self._refetching(paginator):
+            object_list = [obj.pk for obj in object_list]
+        self.cache.set(self._key(paginator, token),
+                       (list(object_list), previous_token, next_token),
+                       self.timeout)
@@ -0,0 +1,170 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.cache import get_cache
+from django.core.paginator import EmptyPage, InvalidPage
+from hashlib import sha1
+from performant_pagination.tokens import Token
+from uuid import uuid4
+
+
+class Checkpoints(object):
+    '''A sparse index of a paginator's ordering, the key of every every'th
+    row, so that page numbers can be turned in to tokens. A page is found by
+    seeking to the nearest checkpoint before it and then skipping fewer than
+    every rows, so however deep the page it's a single, bounded, query, and
+    none at all when the page starts on a checkpoint.
+
+    The checkpoints are built with a walk of the ordering, one query per
+    checkpoint that only returns its key, and kept in backend, a Django cache
+    or LRUCache, by default Django's default cache, for timeout seconds. They
+    should be built, or refreshed, ahead of time in a periodic job, they're
+    never built on the spot. Until they are, only pages within the first every
+    rows can be found and the rest raise InvalidPage. They're stored
+    chunk_size at a time so that no one entry outgrows the cache's limits,
+    e.g. memcached's 1MB, and finding a page only reads a single chunk.
+
+    Rows added or removed after a checkpoint was taken shift the rows that
+    follow it, so pages are approximate until the next refresh. Pages past
+    the last checkpoint, and the every rows after it, are taken to be empty.
+    refresh only walks from the last checkpoint on, which keeps up with
+    tables that mostly grow at the end of their ordering, build starts
+    over.'''
+
+    def __init__(self, every=1000, timeout=60 * 60, backend=None,
+                 prefix='performant_pagination', chunk_size=1000):
+        if every < 1:
+            raise ValueError('every must be at least 1')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        self.every = every
+        self.timeout = timeout
+        self.cache = backend if backend is not None else \
+            get_cache('default')
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+
+    def _key(self, paginator):
+        key = '{0}:{1}:{2}'.format(paginator._queryset_fingerprint(),
+                                   paginator._orderings, self.every)
+        return '{0}:checkpoints:{1}'.format(
+            self.prefix, sha1(key.encode('utf-8')).hexdigest())
+
+    def _chunk_key(self, key, version, index):
+        return '{0}:{1}:{2}'.format(key, version, index)
+
+    def _walk(self, paginator, values=None):
+        # just the keys, no objects
+        qs = paginator.queryset.order_by(*paginator._orderings) \
+            .values_list(*paginator._fields)
+        keys = []
+        while True:
+            seek = qs
+            if values is not None:
+                seek = qs.filter(paginator._values_to_clause(values))
+            # let the database step over the rows between checkpoints
+            rows = list(seek[self.every - 1:self.every])
+            if not rows:
+                return keys
+            values = list(rows[0])
+            keys.append(values)
+
+    def _store(self, paginator, keys):
+        key = self._key(paginator)
+        # chunks go under a new version, so that nobody reading the old ones
+        # sees a mix, and the head that points to them goes last
+        version = uuid4().hex
+        for i in range(0, len(keys), self.chunk_size):
+            self.cache.set(self._chunk_key(key, version, i // self.chunk_size),
+                           keys[i:i + self.chunk_size], self.timeout)
+        self.cache.set(key, (version, len(keys)), self.timeout)
+
+    def build(self, paginator):
+        '''Walks paginator's ordering from the start and stores the
+        checkpoints, which are returned.'''
+        keys = self._walk(paginator)
+        self._store(paginator, keys)
+        return keys
+
+    def refresh(self, paginator):
+        '''Walks on from the last stored checkpoint, adding any new ones, or
+        builds them if there aren't any.'''
+        keys = self.get(paginator)
+        if not keys:
+            return self.build(paginator)
+        keys = keys + self._walk(paginator, keys[-1])
+        self._store(paginator, keys)
+        return keys
+
+    def get(self, paginator):
+        '''Returns the stored checkpoints, or None if they haven't been built,
+        or some of them have since been evicted.'''
+        key = self._key(paginator)
+        head = self.cache.get(key)
+        if head is None:
+            return None
+        version, count = head
+        keys = []
+        for index in range((count + self.chunk_size - 1) // self.chunk_size):
+            chunk = self.cache.get(self._chunk_key(key, version, index))
+            if chunk is None:
+                return None
+            keys.extend(chunk)
+        return keys
+
+    def _checkpoint(self, key, version, n):
+        # the key of the n'th (from 1) checkpoint, or None if it's gone
+        index, offset = divmod(n - 1, self.chunk_size)
+        chunk = self.cache.get(self._chunk_key(key, version, index))
+        return chunk[offset] if chunk is not None else None
+
+    def token_for_page(self, paginator, number):
+        '''Returns the token for page number of paginator, None for the
+        first. Raises EmptyPage if it's past the end, though a page just past
+        the end that starts on a checkpoint will only be found to be empty
+        when it's fetched, and InvalidPage if the checkpoints it needs aren't
+        there.
+
+        At most every rows are skipped, with a single query, to find a page.
+        None at all when it starts on a checkpoint.'''
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        # the token is the key of the final row of the previous page
+        position = (number - 1) * paginator.per_page
+        if not position:
+            return None
+
+        checkpoint, skip = divmod(position, self.every)
+        values = None
+        if checkpoint:
+            key = self._key(paginator)
+            head = self.cache.get(key)
+            if head is None:
+                raise InvalidPage('The checkpoints for that page are not '
+                                  'available')
+            version, count = head
+            if checkpoint > count:
+                # past the last checkpoint, and the rows after it
+                raise EmptyPage('That page contains no results')
+            values = self._checkpoint(key, version, checkpoint)
+            if values is None:
+                raise InvalidPage('The checkpoints for that page are not '
+                                  'available')
+            if not skip:
+                return paginator.codec.encode(Token(values))
+
+        qs = paginator.queryset.order_by(*paginator._orderings) \
+            .values_list(*paginator._fields)
+        if values is not None:
+            qs = qs.filter(paginator._values_to_clause(values))
+        rows = list(qs[skip - 1:skip])
+        if not rows:
+            raise EmptyPage('That page contains no results')
+        return paginator.codec.encode(Token(rows[0]))
@@ -0,0 +1,136 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import connections
+from django.db.models.sql.datastructures import EmptyResultSet
+
+
+def _shallow(obj):
+    # copy.copy would pickle, and so evaluate, querysets
+    clone = obj.__class__.__new__(obj.__class__)
+    clone.__dict__.update(obj.__dict__)
+    return clone
+
+
+class CompiledSeek(object):
+    '''The SQL of one shape of a paginator's query, compiled once, along with
+    where the token's values go in its params. bind puts a new set of values
+    in place and returns a queryset that runs the SQL as is, no cloning,
+    filtering, or compiling required, and builds objects, or rows, from the
+    results the way the original queryset would.
+
+    A bound, see PerformantPaginator's snapshot, is bound along with the
+    values, its params follow theirs.
+
+    compile returns False rather than a CompiledSeek when the query can't be
+    handled, e.g. it could never match anything, or there's no telling
+    exactly where its values are in the params, and the ORM should be used
+    instead. bind returns None when a set of values doesn't fit in the
+    params the way the compiled ones did.'''
+
+    def __init__(self, queryset, sql, params, offset, preps):
+        self.queryset = queryset
+        self.sql = sql
+        self.params = list(params)
+        self.offset = offset
+        # (index, prep) for each of the token's params, in order, index is in
+        # to the values followed by the bound
+        self.preps = preps
+        self.width = None
+
+    @classmethod
+    def compile(cls, paginator, values, backward, inclusive, pks,
+                bound=None, per_page=None):
+        queryset = paginator._seek_queryset(values, backward, inclusive, pks,
+                                            bound, per_page)
+        connection = connections[queryset.db]
+        try:
+            compiler = queryset.query.get_compiler(queryset.db)
+            sql, params = compiler.as_sql()
+            if values is None and bound is None:
+                return cls(queryset, sql, params, 0, [])
+            # the same query without the token, its params are ours with the
+            # token's taken out
+            base = paginator._seek_queryset(None, backward, inclusive, pks,
+                                            per_page=per_page)
+            _, base_params = base.query.get_compiler(base.db).as_sql()
+        except EmptyResultSet:
+            return False
+
+        # (offset in to values + bound, terms)
+        clauses = []
+        if values is not None:
+            clauses.append((0, paginator._clause_terms(len(values), backward,
+                                                       inclusive)))
+        if bound is not None:
+            clauses.append((len(values or []),
+                            paginator._clause_terms(len(bound), True, True)))
+        preps = []
+        for offset, (lead, groups) in clauses:
+            terms = ([lead] if lead else []) + \
+                [term for group in groups for term in group]
+            for index, lookup in terms:
+                field = paginator._key_fields[index]
+
+                def prep(value, field=field, lookup=lookup):
+                    return field.get_db_prep_lookup(lookup, value,
+                                                    connection=connection)
+
+                preps.append((offset + index, prep))
+
+        compiled = cls(queryset, sql, params, None, preps)
+        try:
+            binding = compiled._binding(values, bound)
+        except Exception:
+            return False
+        # the token's params usually come after everything else in the
+        # where, but having, annotations, etc. can follow them. wherever
+        # they are, everything around them has to match the query without
+        # them, and there's only to be one place that works
+        n = len(binding)
+        params, base_params = list(params), list(base_params)
+        offsets = [offset for offset in range(len(base_params) + 1)
+                   if params[:offset] == base_params[:offset] and
+                   params[offset:offset + n] == binding and
+                   params[offset + n:] == base_params[offset:]]
+        if len(offsets) != 1:
+            return False
+        compiled.offset = offsets[0]
+        compiled.width = n
+        return compiled
+
+    def _binding(self, values, bound=None):
+        values = list(values or []) + list(bound or [])
+        binding = []
+        for index, prep in self.preps:
+            binding.extend(prep(values[index]))
+        return binding
+
+    def _bind_params(self, values, bound=None):
+        binding = self._binding(values, bound)
+        if len(binding) != self.width or None in binding:
+            # not the way the ORM would have put them, e.g. None would be an
+            # IS NULL
+            return None
+        params = list(self.params)
+        params[self.offset:self.offset + len(binding)] = binding
+        return params
+
+    def bind(self, values, bound=None):
+        '''Returns a queryset for values, and bound, or None if they don't
+        line up with the compiled params.'''
+        sql, params = self.sql, self.params
+        if self.preps:
+            params = self._bind_params(values, bound)
+            if params is None:
+                return None
+        query = _shallow(self.queryset.query)
+        compiler = query.get_compiler(self.queryset.db)
+        compiler.as_sql = lambda *args, **kwargs: (sql, params)
+        query.get_compiler = lambda *args, **kwargs: compiler
+        queryset = _shallow(self.queryset)
+        queryset.query = query
+        return queryset
@@ -0,0 +1,90 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import DatabaseError, connections, transaction
+import re
+
+
+_explain_rows_re = re.compile(r'rows=(\d+)')
+
+
+def _unfiltered(queryset):
+    # grouped, annotated, or distinct querysets don't have a row per row of
+    # the table either
+    query = queryset.query
+    return not (query.where or query.extra or query.distinct or
+                query.group_by is not None or query.aggregates or
+                query.having or query.low_mark or
+                query.high_mark is not None)
+
+
+def _postgresql(queryset, cursor):
+    if _unfiltered(queryset):
+        # the whole table, which the planner keeps track of
+        cursor.execute('SELECT reltuples FROM pg_class '
+                       'WHERE oid = %s::regclass',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        # tables that have never been analyzed will be -1 (or 0)
+        return int(row[0]) if row and row[0] > 0 else None
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    cursor.execute('EXPLAIN ' + sql, params)
+    # the top node of the plan has the estimate for the whole thing
+    match = _explain_rows_re.search(cursor.fetchone()[0])
+    return int(match.group(1)) if match else None
+
+
+def _mysql(queryset, cursor):
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    cursor.execute('EXPLAIN ' + sql, params)
+    columns = [c[0].lower() for c in cursor.description]
+    row = cursor.fetchone()
+    return int(row[columns.index('rows')]) if row else None
+
+
+def _sqlite(queryset, cursor):
+    if not _unfiltered(queryset):
+        # sqlite's planner doesn't expose estimates for filters
+        return None
+    # only there once the table's been ANALYZE'd, each of its rows starts
+    # with the number of rows in the table
+    cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+                   [queryset.model._meta.db_table])
+    counts = [int(row[0].split()[0]) for row in cursor.fetchall()]
+    return max(counts) if counts else None
+
+
+_estimators = {
+    'mysql': _mysql,
+    'postgresql': _postgresql,
+    'sqlite': _sqlite,
+}
+
+
+def estimate_count(queryset):
+    '''Returns the database's estimate of the number of rows in queryset,
+    without counting them, or None when it doesn't have one.
+
+    Estimates come from the planner's statistics, e.g. reltuples or EXPLAIN
+    on PostgreSQL, EXPLAIN on MySQL, and sqlite_stat1 on SQLite, and are only
+    as fresh as the last time the table was analyzed. SQLite can only estimate
+    whole tables.'''
+    connection = connections[queryset.db]
+    estimator = _estimators.get(connection.vendor)
+    if estimator is None:
+        return None
+    try:
+        # in a savepoint, a failure would otherwise abort the caller's
+        # transaction on PostgreSQL
+        with transaction.atomic(using=queryset.db):
+            cursor = connection.cursor()
+            try:
+                return estimator(queryset, cursor)
+            finally:
+                cursor.close()
+    except DatabaseError:
+        # most likely the statistics aren't there
+        return None
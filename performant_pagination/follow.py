@@ -0,0 +1,130 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db.models.signals import post_save
+from performant_pagination.tokens import Token
+from threading import Event
+from time import time
+
+
+def _wait(event, seconds):
+    # True if event was set before seconds were up
+    return event.wait(seconds)
+
+
+class Follower(object):
+    '''Tails a paginator's ordering, yielding lists of the rows past its
+    position as they show up. Rows come up to per_page at a time, each list is
+    a single query, the page's query without the previous token or page that
+    page would add, and a full list is followed straight away by the next.
+
+    When there's nothing new it waits interval seconds before looking again,
+    multiplying the wait by backoff after each empty look up to max_interval,
+    so an idle tail settles down to a query every max_interval. With wake
+    (the default) a post_save of the queryset's model in this process, while
+    it's being iterated, cuts the wait short, and resets it. Saves elsewhere,
+    and bulk_create, which doesn't send post_save, are found by polling.
+
+    Iteration ends after close, or after timeout seconds without anything
+    new if there's a timeout. token is where the tail's got to, the token of
+    the final row yielded, which can be given to a later follow to pick up
+    from there.
+
+    Only rows past the position in the ordering are seen, so it's best used
+    on ascending orderings whose new rows go at the end, e.g. 'pk' or
+    ('created',).'''
+
+    def __init__(self, paginator, token=None, interval=0.5, max_interval=30,
+                 backoff=2, wake=True, timeout=None):
+        if interval <= 0 or max_interval < interval or backoff < 1:
+            raise ValueError('interval must be positive and at most '
+                             'max_interval, and backoff at least 1')
+        self.paginator = paginator
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.token = token
+        self._values = None
+        self._inclusive = False
+        if token:
+            # only the position matters, whichever way and whatever bound
+            # the token had we're headed forward and past the end
+            decoded = paginator._decode_token(token)
+            self._values = decoded.values
+            self._inclusive = decoded.inclusive
+        self._event = Event()
+        self._closed = False
+        self._model = paginator.queryset.model if wake else None
+        self._connected = False
+
+    def __repr__(self):
+        return '<Follower (%s, %s)>' % (self.paginator, self.token)
+
+    def _saved(self, **kwargs):
+        self._event.set()
+
+    def _fetch(self):
+        paginator = self.paginator
+        rows = list(paginator._seek(self._values, inclusive=self._inclusive))
+        more = len(rows) > paginator.per_page
+        rows = rows[:paginator.per_page]
+        if rows:
+            self._values = paginator._object_to_values(rows[-1])
+            self._inclusive = False
+            self.token = paginator.codec.encode(Token(self._values))
+        return rows, more
+
+    def _connect(self):
+        # only while we're being iterated, so that followers that never are
+        # aren't held on to, or woken, by post_save
+        if self._model is not None and not self._connected:
+            post_save.connect(self._saved, sender=self._model, weak=False,
+                              dispatch_uid=id(self))
+            self._connected = True
+
+    def _disconnect(self):
+        if self._connected:
+            post_save.disconnect(sender=self._model, dispatch_uid=id(self))
+            self._connected = False
+
+    def __iter__(self):
+        interval = self.interval
+        idle_since = time()
+        self._connect()
+        try:
+            while not self._closed:
+                # anything saved from here on will wake the wait that follows
+                self._event.clear()
+                rows, more = self._fetch()
+                if rows:
+                    yield rows
+                    interval = self.interval
+                    idle_since = time()
+                    if more:
+                        continue
+                if self._closed:
+                    break
+                wait = interval
+                if self.timeout is not None:
+                    left = idle_since + self.timeout - time()
+                    if left <= 0:
+                        break
+                    wait = min(interval, left)
+                if _wait(self._event, wait):
+                    # something's been saved, look now and soon after
+                    interval = self.interval
+                else:
+                    interval = min(interval * self.backoff, self.max_interval)
+        finally:
+            # including when we're abandoned part way through
+            self.close()
+
+    def close(self):
+        '''Stops the tail, a wait in progress is cut short.'''
+        self._closed = True
+        self._disconnect()
+        self._event.set()
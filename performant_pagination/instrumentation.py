@@ -0,0 +1,199 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from bisect import bisect_left
+from django.dispatch import Signal
+from threading import Lock
+
+
+# sent by PerformantPaginator.page, with the paginator and a PageRecord, for
+# every page it serves. nothing is timed unless something's listening
+page_served = Signal(providing_args=['paginator', 'record'])
+
+
+class PageRecord(object):
+    '''What went in to serving a page. Times are in seconds and are None for
+    the parts that didn't happen, e.g. everything but total_time for a cached
+    or prefetched page.
+
+    queries is the number of queries it took, none for a cached page and
+    only what it took to take it for a prefetched one. cache_hit is None
+    without a page_cache, prefetched None without a prefetcher.'''
+
+    def __init__(self, token):
+        self.token = token
+        self.rows = 0
+        self.queries = 0
+        self.decode_time = None
+        self.query_time = None
+        self.encode_time = None
+        self.total_time = None
+        self.cache_hit = None
+        self.prefetched = None
+
+    def __repr__(self):
+        return '<PageRecord (%s, %d rows, %s)>' % (self.token, self.rows,
+                                                   self.total_time)
+
+
+class _CountingCursor(object):
+    # wraps a cursor, counting its executes and passing everything else on
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class QueryCounter(object):
+    '''Counts the queries run on connection, by this thread, while it's
+    entered. Only executes are counted, the SQL isn't logged or kept.'''
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+
+    def __enter__(self):
+        # whatever's in place, another counter's cursor if we're nested
+        self._cursor = self.connection.__dict__.get('cursor')
+        cursor = self.connection.cursor
+
+        def counting_cursor():
+            return _CountingCursor(cursor(), self)
+
+        self.connection.cursor = counting_cursor
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._cursor is None:
+            del self.connection.cursor
+        else:
+            self.connection.cursor = self._cursor
+
+
+class Histogram(object):
+    '''Counts of values falling in to buckets, each bucket being the values
+    less than or equal to its bound and greater than the previous one's, with
+    a final bucket for anything above the largest bound.'''
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def as_dict(self):
+        return {
+            'bounds': self.bounds,
+            'counts': list(self.counts),
+            'total': self.total,
+            'sum': self.sum,
+        }
+
+
+class PageStats(object):
+    '''Aggregates page_served records in to counters, of pages, rows,
+    queries, etc., and histograms of times, in milliseconds, overall and for
+    each model and ordering, and holds on to the slowest pages seen so that
+    the tokens that caused them can be looked in to.
+
+        stats = PageStats()
+        stats.connect()
+        ...
+        stats.snapshot()
+
+    It's thread-safe.'''
+
+    BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+    TIMES = ('decode_time', 'query_time', 'encode_time', 'total_time')
+
+    def __init__(self, slowest=10, bounds=BOUNDS):
+        self.slowest = slowest
+        self.bounds = bounds
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._slowest = []
+
+    def connect(self):
+        page_served.connect(self.receive, dispatch_uid=id(self))
+
+    def disconnect(self):
+        page_served.disconnect(dispatch_uid=id(self))
+
+    def _new(self):
+        stats = dict((name, Histogram(self.bounds)) for name in self.TIMES)
+        stats.update(pages=0, rows=0, queries=0, cache_hits=0,
+                     cache_misses=0, prefetch_hits=0, prefetch_misses=0)
+        return stats
+
+    def _add(self, key, record):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = self._new()
+        stats['pages'] += 1
+        stats['rows'] += record.rows
+        stats['queries'] += record.queries
+        if record.cache_hit is not None:
+            stats['cache_hits' if record.cache_hit else 'cache_misses'] += 1
+        if record.prefetched is not None:
+            stats['prefetch_hits' if record.prefetched
+                  else 'prefetch_misses'] += 1
+        for name in self.TIMES:
+            value = getattr(record, name)
+            if value is not None:
+                stats[name].add(value * 1000)
+
+    def receive(self, sender, paginator, record, **kwargs):
+        meta = paginator.queryset.model._meta
+        key = '{0}.{1}:{2}'.format(meta.app_label, meta.object_name,
+                                   ','.join(paginator._orderings))
+        with self._lock:
+            self._add(None, record)
+            self._add(key, record)
+            if self.slowest:
+                self._slowest.append((record.total_time, key, record.token))
+                self._slowest.sort(reverse=True)
+                del self._slowest[self.slowest:]
+
+    def snapshot(self):
+        '''Returns the stats so far as a dict. 'all' covers every page,
+        'orderings' has the same for each model and ordering, and 'slowest'
+        is a list of (total_time, model and ordering, token).'''
+
+        def as_dict(stats):
+            return dict((k, v.as_dict() if isinstance(v, Histogram) else v)
+                        for k, v in stats.items())
+
+        with self._lock:
+            return {
+                'all': as_dict(self._stats.get(None) or self._new()),
+                'orderings': dict((k, as_dict(v))
+                                  for k, v in self._stats.items()
+                                  if k is not None),
+                'slowest': list(self._slowest),
+            }
@@ -0,0 +1,79 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from performant_pagination.advisor import advise
+from performant_pagination.pagination import PerformantPaginator
+
+try:
+    from django.apps import apps
+    get_model = apps.get_model
+except ImportError:
+    from django.db.models import get_model
+
+
+class Command(BaseCommand):
+    args = '<app_label.Model> [field=value ...]'
+    help = 'EXPLAINs the queries a PerformantPaginator would run for a ' \
+        'model, optionally filtered, and ordering, and suggests an index if ' \
+        'they sort or scan the whole table.'
+    option_list = BaseCommand.option_list + (
+        make_option('--ordering', default='pk',
+                    help='comma separated fields, as passed to '
+                    'PerformantPaginator, default pk'),
+        make_option('--per-page', type='int', default=25),
+        make_option('--database', default=None),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('a model, app_label.Model, is required')
+        try:
+            app_label, model_name = args[0].split('.')
+        except ValueError:
+            raise CommandError('model must be app_label.Model')
+        try:
+            model = get_model(app_label, model_name)
+        except LookupError:
+            # apps.get_model raises rather than returning None
+            model = None
+        if model is None:
+            raise CommandError('unknown model {0}'.format(args[0]))
+
+        filters = {}
+        for arg in args[1:]:
+            if '=' not in arg:
+                raise CommandError('filters must be field=value, not {0}'
+                                   .format(arg))
+            field, value = arg.split('=', 1)
+            filters[field] = value
+
+        queryset = model._default_manager.filter(**filters)
+        if options.get('database'):
+            queryset = queryset.using(options['database'])
+        ordering = options.get('ordering') or 'pk'
+        if ',' in ordering:
+            ordering = tuple(ordering.split(','))
+        paginator = PerformantPaginator(queryset,
+                                        per_page=options.get('per_page', 25),
+                                        ordering=ordering)
+
+        advice = advise(paginator)
+        if advice is None:
+            raise CommandError("can't check indexes on the {0} database"
+                               .format(queryset.db))
+        verbosity = int(options.get('verbosity', 1))
+        if verbosity > 1:
+            for direction in sorted(advice.plans):
+                self.stdout.write('{0}:'.format(direction))
+                for line in advice.plans[direction]:
+                    self.stdout.write('    {0}'.format(line))
+        self.stdout.write('{0}'.format(advice))
+        if advice.problems:
+            raise CommandError('{0} ordered by {1} may not be using an index'
+                               .format(args[0],
+                                       ','.join(paginator._orderings)))
@@ -0,0 +1,225 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from heapq import heapify, heappop, heappush
+from multiprocessing.pool import ThreadPool
+from performant_pagination.pagination import PerformantPage, \
+    PerformantPaginator
+from performant_pagination.prefetch import _close_connections
+from performant_pagination.tokens import Base64TokenCodec, Token
+from threading import Condition
+
+
+class _Reversed(object):
+    # flips the comparison of value, for descending fields
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class MergePaginator(object):
+    '''Pages through several querysets, e.g. the same table on a number of
+    database shards, as if they were one, in a shared ordering. Each page
+    fetches per_page + 1 rows from each queryset, from where it left off, and
+    merges them, so a page costs a single round of queries however deep it
+    is.
+
+    Queries are run concurrently in a pool of workers threads, by default one
+    per queryset. The threads keep their database connections open from page
+    to page, close shuts them, and the threads, down, as does leaving a with
+    block. With workers=1 they're run one after another in the calling
+    thread. A pool, anything with map, may be provided instead, in which case
+    looking after its connections is up to its owner.
+
+    Tokens hold each queryset's position, the key of the last of its rows
+    that's been served, and are only good for going forward, previous_token
+    is always None. Rows that are equal in the ordering are served in the
+    order of querysets.
+
+    Each queryset's rows come back in the database's order, they're merged in
+    Python's, so the two have to agree. Numbers, dates and the like always do,
+    text only does when the columns' collation compares by code point, e.g.
+    C or binary, otherwise rows will be served out of order.'''
+
+    START = 0
+    AT = 1
+    DONE = 2
+
+    def __init__(self, querysets, per_page=25, ordering='pk', codec=None,
+                 workers=None, pool=None):
+        if not querysets:
+            raise ValueError('at least one queryset is required')
+        self.per_page = int(per_page)
+        self.ordering = ordering
+        self.codec = codec or Base64TokenCodec()
+        self.paginators = [PerformantPaginator(qs, per_page=per_page,
+                                               ordering=ordering,
+                                               codec=self.codec)
+                           for qs in querysets]
+        self.workers = len(querysets) if workers is None else workers
+        self._pool = pool
+        self._owns_pool = pool is None
+
+        descending = [d for _, d in self.paginators[0]._keys]
+
+        def sort_key(values):
+            return tuple(_Reversed(v) if d else v
+                         for v, d in zip(values, descending))
+
+        self._sort_key = sort_key
+
+    def __repr__(self):
+        return '<MergePaginator (%d, %d, %s)>' % (len(self.paginators),
+                                                  self.per_page,
+                                                  self.ordering)
+
+    def count(self):
+        return None
+
+    def default_page_number(self):
+        return None
+
+    def validate_number(self, number):
+        return number
+
+    def _encode(self, positions):
+        values = []
+        for position in positions:
+            if position is None:
+                values.append(self.START)
+            elif position is self.DONE:
+                values.append(self.DONE)
+            else:
+                values.append(self.AT)
+                values.extend(position)
+        return self.codec.encode(Token(values))
+
+    def _decode(self, token):
+        values = self.codec.decode(token).values
+        positions = []
+        try:
+            for paginator in self.paginators:
+                state = int(values.pop(0))
+                if state == self.START:
+                    positions.append(None)
+                elif state == self.DONE:
+                    positions.append(self.DONE)
+                elif state == self.AT:
+                    n = len(paginator._fields)
+                    if len(values) < n:
+                        raise ValueError('missing values')
+                    positions.append([field.to_python(value) for field, value
+                                      in zip(paginator._key_fields, values)])
+                    del values[:n]
+                else:
+                    raise ValueError('unknown state')
+        except (IndexError, TypeError, ValueError, ValidationError):
+            raise InvalidPage('Page token is invalid')
+        if values:
+            raise InvalidPage('Page token is invalid')
+        return positions
+
+    def _fetch(self, args):
+        paginator, position = args
+        qs = paginator.queryset
+        if position is not None:
+            qs = qs.filter(paginator._values_to_clause(position))
+        return list(qs.order_by(*paginator._orderings)[:self.per_page + 1])
+
+    def _fetch_all(self, positions):
+        work = [(paginator, position) for paginator, position
+                in zip(self.paginators, positions)
+                if position is not self.DONE]
+        if not self._owns_pool:
+            fetched = self._pool.map(self._fetch, work)
+        elif self.workers <= 1 or len(work) <= 1:
+            fetched = [self._fetch(w) for w in work]
+        else:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            fetched = self._pool.map(self._fetch, work)
+        fetched = iter(fetched)
+        return [[] if position is self.DONE else next(fetched)
+                for position in positions]
+
+    def page(self, token=None):
+        # see PerformantPaginator.page
+        if token == 1:
+            token = None
+        positions = self._decode(token) if token else \
+            [None] * len(self.paginators)
+
+        rows = self._fetch_all(positions)
+        values = [[paginator._object_to_values(obj) for obj in shard_rows]
+                  for paginator, shard_rows in zip(self.paginators, rows)]
+
+        # the head of each shard, the shard's index breaks ties
+        heap = [(self._sort_key(shard_values[0]), i, 0)
+                for i, shard_values in enumerate(values) if shard_values]
+        heapify(heap)
+        object_list = []
+        taken = [0] * len(rows)
+        while heap and len(object_list) < self.per_page:
+            _, i, j = heappop(heap)
+            object_list.append(rows[i][j])
+            taken[i] = j + 1
+            if j + 1 < len(rows[i]):
+                heappush(heap, (self._sort_key(values[i][j + 1]), i, j + 1))
+
+        next_token = None
+        if heap:
+            # something's left, move each shard on past what we took from it
+            next_positions = []
+            for position, shard_values, n in zip(positions, values, taken):
+                if n == len(shard_values):
+                    # all of it, and it was short, so there's nothing more
+                    next_positions.append(self.DONE)
+                elif n:
+                    next_positions.append(shard_values[n - 1])
+                else:
+                    next_positions.append(position)
+            next_token = self._encode(next_positions)
+
+        return PerformantPage(self, object_list, None, token, next_token)
+
+    def _close_connections(self):
+        # each thread has its own connections that only it can close, hold
+        # every one of them up until they all have so that none of them runs
+        # this twice while another doesn't run it at all
+        closed = [0]
+        condition = Condition()
+
+        def close(_):
+            _close_connections()
+            with condition:
+                closed[0] += 1
+                condition.notify_all()
+                while closed[0] < self.workers:
+                    condition.wait()
+
+        self._pool.map(close, range(self.workers), chunksize=1)
+
+    def close(self):
+        if self._owns_pool and self._pool is not None:
+            self._close_connections()
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
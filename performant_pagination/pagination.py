@@ -4,8 +4,25 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
-from base64 import b64decode, b64encode
+from copy import copy
+from django.core.exceptions import ValidationError
 from django.core.paginator import Page, InvalidPage
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.db.models.query import ValuesListQuerySet, ValuesQuerySet
+from django.utils import six
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter, itemgetter
+from performant_pagination.advisor import checking_enabled, \
+    warn_if_unindexed
+from performant_pagination.caching import queryset_fingerprint
+from performant_pagination.compiled import CompiledSeek
+from performant_pagination.counting import estimate_count
+from performant_pagination.follow import Follower
+from performant_pagination.instrumentation import PageRecord, \
+    QueryCounter, page_served
+from performant_pagination.tokens import Base64TokenCodec, Token
+from time import time
 
 
 # we inherit from Page, even though it's a bit odd since we're so
@@ -51,13 +68,83 @@ class PerformantPage(Page):
 class PerformantPaginator(object):
 
     def __init__(self, queryset, per_page=25, ordering='pk', allow_count=False,
-                 allow_empty_first_page=True, orphans=0):
+                 allow_empty_first_page=True, orphans=0, codec=None,
+                 count_threshold=10000, count_cache=None, page_cache=None,
+                 prefetcher=None, checkpoints=None, late_lookup=False,
+                 compiled=False, snapshot=False, adaptive=None):
         '''As a general rule you should ensure there's an appropriate index for
-        the field provided in ordering.
+        the field(s) provided in ordering.
+
+        ordering may be a single field, which must then be unique, or a
+        sequence of fields, e.g. ('-updated', '-pk'), which will be walked as a
+        composite key. If a composite ordering doesn't include the primary key
+        it's appended, in the direction of the final field, as a tie-breaker.
+        An index on the full set of columns will serve each page as a single
+        range seek.
+
+        queryset may be a values() or values_list() queryset, in which case
+        pages will be made up of dicts or tuples rather than model instances,
+        skipping their construction. The rows must include the ordering
+        field(s).
 
         allow_count (default False) indicates whether or not to allow count
         queries that can be extremely expensive on large and fast changing
-        datasets.
+        datasets. allow_count='estimate' will instead use the database's
+        estimate of the count, see performant_pagination.counting, falling back
+        to an exact count when there isn't one or it's below count_threshold
+        (default 10000). count_is_exact will say which it was. Exact counts
+        will be cached by count_cache if provided, see
+        performant_pagination.caching.CountCache.
+
+        page_cache, see performant_pagination.caching.PageCache, will cache
+        pages, which is mostly useful for the first few of popular listings.
+
+        prefetcher, see performant_pagination.prefetch.Prefetcher, will fetch
+        each page's next page in the background.
+
+        checkpoints, see performant_pagination.checkpoints.Checkpoints, allows
+        page to be passed page numbers, ints, as well as tokens.
+
+        late_lookup (default False) fetches each page in two queries, first
+        just the primary keys, which with an index on the ordering and pk can
+        be found without touching the table, and then the objects for them.
+        It's worth it for tables with wide rows, large text or json columns
+        etc., where the seek would otherwise drag them along. It doesn't apply
+        to values() querysets.
+
+        compiled (default False) compiles the SQL for each shape of query, the
+        first page, forward or backward from a token, etc., once and then only
+        binds the token's values to it, skipping the queryset cloning and SQL
+        compilation that otherwise happens for every page, see
+        performant_pagination.compiled. The queryset must not be changed once
+        it's been given to the paginator.
+
+        snapshot (default False) pins each walk to the rows that were there
+        when it started. The key of the final row in the ordering is looked
+        up, an extra, single row, index seek, when a walk starts, i.e. for a
+        page without a bounded token, and carried in each token that follows.
+        Every page's query is then a closed range of the index, and rows
+        added past the end of the ordering in the meantime won't keep
+        extending the walk. Tokens with a bound are honored whatever
+        snapshot's set to.
+
+        adaptive, see performant_pagination.sizing.AdaptivePageSize, sizes
+        each page, within its min and max, to a target query time and/or
+        number of bytes, from how the pages before it went. per_page is then
+        only where the first walks start from. Page numbers, checkpoints,
+        need a fixed per_page and can't be used with it.
+
+        codec (default Base64TokenCodec) turns tokens in to strings and back,
+        see performant_pagination.tokens. BinaryTokenCodec makes for shorter,
+        URL-safe, and optionally signed tokens.
+
+        Each page served sends performant_pagination.instrumentation's
+        page_served signal with a record of where the time went, PageStats
+        will aggregate them.
+
+        With DEBUG and the PERFORMANT_PAGINATION_CHECK_INDEXES setting on, an
+        IndexWarning is warned if the queries don't look to be using an index,
+        see performant_pagination.advisor.
 
         allow_empty_first_page and orphans are currently ignored and only exist
         to allow dropping in place of Django's built-in pagination.
@@ -66,77 +153,284 @@ class PerformantPaginator(object):
         self.per_page = int(per_page)
         self.ordering = ordering
         self.allow_count = allow_count
-
-        field = ordering.replace('-', '')
-        self._reverse_ordering = field if ordering[0] == '-' else \
-            '-{0}'.format(ordering)
-        self._field = field
+        self.count_threshold = count_threshold
+        self.count_is_exact = None
+        self.count_cache = count_cache
+        self.page_cache = page_cache
+        self.prefetcher = prefetcher
+        self.checkpoints = checkpoints
+        self.late_lookup = late_lookup
+        self.compiled = compiled
+        self._compiled = {}
+        self._fingerprint = None
+        self.snapshot = snapshot
+        if adaptive and checkpoints:
+            raise ValueError('checkpoints need a fixed per_page, they can not '
+                             'be used with adaptive')
+        self.adaptive = adaptive
+        self.codec = codec or Base64TokenCodec()
+
+        if isinstance(ordering, six.string_types):
+            orderings = [ordering]
+        else:
+            orderings = list(ordering)
+            pk_name = queryset.model._meta.pk.name
+            if not any(o.lstrip('-') in ('pk', pk_name) for o in orderings):
+                # tie-break on pk so that the composite key is unique
+                orderings.append('-pk' if orderings[-1][0] == '-' else 'pk')
+
+        self._orderings = tuple(orderings)
+        # list of (field, descending) pairs that make up our key
+        self._keys = [(o.lstrip('-'), o[0] == '-') for o in orderings]
+        self._reverse_orderings = tuple(f if d else '-{0}'.format(f)
+                                        for f, d in self._keys)
+        self._fields = tuple(f for f, _ in self._keys)
+
+        # resolve each of our fields once, up front, in to the model field
+        # that will convert values coming out of tokens and an accessor that
+        # pulls the value out of an object or row
+        self._key_fields = []
+        self._getters = []
+        if queryset is not None:
+            model = queryset.model
+            relations = set()
+            for field in self._fields:
+                path, key_field = self._resolve_field(model, field)
+                self._key_fields.append(key_field)
+                self._getters.append(attrgetter('.'.join(path)))
+                if len(path) > 1:
+                    relations.add('__'.join(path[:-1]))
+
+            if isinstance(queryset, ValuesQuerySet):
+                if late_lookup:
+                    raise ValueError('late_lookup does not apply to values '
+                                     'querysets')
+                # where to find our key in each row when the queryset is made
+                # up of values() or values_list() rows rather than objects
+                self._getters = self._resolve_row_getters(queryset)
+            elif relations:
+                # we'll be walking these relationships to get at the key,
+                # have them come along with the objects rather than lazily
+                # loading them one query at a time
+                self.queryset = queryset.select_related(*relations)
+
+            if checking_enabled():
+                warn_if_unindexed(self)
+
+    def _resolve_field(self, model, field):
+        meta = model._meta
+        if field == 'pk':
+            return (meta.pk.attname,), meta.pk
+        pieces = field.split('__')
+        # traverse relationships, -1 will be our final field
+        for piece in pieces[:-1]:
+            # grab the ForeignKey field, then its RelatedObject, which holds
+            # it's parent_model (the one at the other end of the relationship)
+            # and finally its _meta which is what we're after
+            meta = meta.get_field(piece).related.parent_model._meta
+        key_field = meta.get_field(pieces[-1])
+        # the final field's attname so that foreign keys give us their id
+        return tuple(pieces[:-1]) + (key_field.attname,), key_field
+
+    def _resolve_row_getters(self, queryset):
+        query = queryset.query
+        extra_names = list(query.extra_select)
+        aggregate_names = list(query.aggregate_select)
+        tuples = isinstance(queryset, ValuesListQuerySet)
+        if tuples and queryset._fields:
+            # mirror the way ValuesListQuerySet lays out its rows
+            names = list(queryset._fields) + \
+                [f for f in aggregate_names if f not in queryset._fields]
+        else:
+            names = extra_names + queryset.field_names + aggregate_names
+
+        meta = queryset.model._meta
+        getters = []
+        for field, key_field in zip(self._fields, self._key_fields):
+            if field == 'pk':
+                candidates = ('pk', meta.pk.name, meta.pk.attname)
+            else:
+                # relationships may be there by name or attname (their id)
+                prefix = field.rsplit('__', 1)[0] + '__' \
+                    if '__' in field else ''
+                candidates = (field, prefix + key_field.attname)
+            found = [c for c in candidates if c in names]
+            if not found:
+                raise ValueError('ordering field {0} is not in the values'
+                                 .format(field))
+            if not tuples:
+                getters.append(itemgetter(found[0]))
+            elif queryset.flat:
+                # flat rows are the value itself
+                getters.append(lambda row: row)
+            else:
+                getters.append(itemgetter(names.index(found[0])))
+        return getters
 
     def __repr__(self):
-        return '<PerformantPaginator (%d, %s %d)>' % (self.per_page,
+        return '<PerformantPaginator (%d, %s %s)>' % (self.per_page,
                                                       self.ordering,
                                                       self.allow_count)
 
     def count(self):
         '''Counting the number of items is expensive, so by default it's not
         supported and None will be returned.'''
-        return self.queryset.count() if self.allow_count else None
+        if not self.allow_count:
+            return None
+        if self.allow_count == 'estimate':
+            estimate = estimate_count(self.queryset)
+            if estimate is not None and estimate >= self.count_threshold:
+                self.count_is_exact = False
+                return estimate
+        self.count_is_exact = True
+        if self.count_cache:
+            return self.count_cache.count(self.queryset)
+        return self.queryset.count()
 
     def default_page_number(self):
         return None
 
     def validate_number(self, number):
+        # tokens are checked by the codec when they're used, in page, where
+        # invalid ones will raise InvalidPage before anything is queried
+        return number
+
+    def _queryset_fingerprint(self):
+        # the queryset doesn't change once it's ours, so neither does its SQL,
+        # there's no need to compile it every time a cache wants a key
+        if self._fingerprint is None:
+            self._fingerprint = queryset_fingerprint(self.queryset)
+        return self._fingerprint
+
+    def _object_to_values(self, obj):
+        # the raw python values of obj's key
+        return [getter(obj) for getter in self._getters]
+
+    def _object_to_token(self, obj, backward=False, bound=None, size=None):
+        return self.codec.encode(Token(self._object_to_values(obj), backward,
+                                       bound=bound, size=size))
+
+    def _decode_token(self, token):
+        token = self.codec.decode(token)
+        # tokens made from values may only have a prefix of the key
+        if not 0 < len(token.values) <= len(self._fields):
+            raise InvalidPage('Page token is invalid')
+        # bounds are always the full key
+        if token.bound is not None and len(token.bound) != len(self._fields):
+            raise InvalidPage('Page token is invalid')
+        if token.size is not None and token.size < 1:
+            raise InvalidPage('Page token is invalid')
         try:
-            return b64decode(number, validate=True)
-        except TypeError:
-            raise InvalidPage("Page number is invalid")
-
-    def _object_to_token(self, obj):
-        field = self._field
-        if field == 'pk':
-            value = obj._meta.pk.value_to_string(obj)
-        else:
-            pieces = field.split('__')
-            if len(pieces) > 1:
-                # traverse relationships, -1 will be our final field
-                for piece in pieces[:-1]:
-                    obj = getattr(obj, piece)
-            # obj is now the object on which our final field lives
-            value = obj._meta.get_field(pieces[-1]).value_to_string(obj)
-
-        # return our value
-        return b64encode(value)
-
-    def _token_to_clause(self, token, rev=False):
+            # depending on the codec values may be strings, to_python will
+            # sort them out
+            token.values = [field.to_python(value) for field, value
+                            in zip(self._key_fields, token.values)]
+            if token.bound is not None:
+                token.bound = [field.to_python(value) for field, value
+                               in zip(self._key_fields, token.bound)]
+        except (OverflowError, ValidationError):
+            # int(float('inf')) overflows rather than failing validation
+            raise InvalidPage('Page token is invalid')
+        return token
+
+    def _high_water_mark(self):
+        # the key of the final row in our ordering, None if there aren't any
+        rows = list(self.queryset.order_by(*self._reverse_orderings)
+                    .values_list(*self._fields)[:1])
+        return list(rows[0]) if rows else None
+
+    def _clause_terms(self, n, rev=False, inclusive=False):
+        # the terms of the clause for the first n fields of our key, (index,
+        # lookup) pairs, as a leading term, or None, that's AND'd with a list
+        # of OR'd lists of AND'd terms.
+        #
         # in the forward direction we want things that are greater than our
         # value, but if the ordering is -, we want less than. if rev=True we
-        # fip it
-        direction = ('lt', 'gt') if rev else ('gt', 'lt')
-        if self.ordering[0] == '-':
-            d = direction[1]
-        else:
-            d = direction[0]
-
-        token = b64decode(token)
-
-        field = self._field
-        meta = self.queryset.model._meta
-        if field == 'pk':
-            value = meta.pk.to_python(token)
+        # fip it. if inclusive things equal to them are wanted as well
+        def op(descending, inclusive=False):
+            lookup = 'lt' if descending != rev else 'gt'
+            return lookup + 'e' if inclusive else lookup
+
+        # expanded form of the row-value comparison (a, b) > (x, y), which
+        # mixed directions need anyway:
+        #   (a > x) OR (a = x AND b > y)
+        # inclusive makes the final comparison b >= y
+        groups = []
+        for i, (_, descending) in enumerate(self._keys[:n]):
+            last = inclusive and i == n - 1
+            groups.append([(i, op(descending, last))] +
+                          [(j, 'exact') for j in range(i)])
+
+        lead = None
+        if n > 1:
+            # the OR'd terms can keep some databases from seeking on the
+            # index, a redundant a >= x bounds the range so that they will
+            lead = (0, op(self._keys[0][1], True))
+
+        return lead, groups
+
+    def _values_to_clause(self, values, rev=False, inclusive=False):
+        # values may be a prefix of our key
+        def q(index, lookup):
+            return Q(**{'{0}__{1}'.format(self._fields[index], lookup):
+                        values[index]})
+
+        lead, groups = self._clause_terms(min(len(values), len(self._keys)),
+                                          rev, inclusive)
+        clause = None
+        for group in groups:
+            term = q(*group[0])
+            for index, lookup in group[1:]:
+                term &= q(index, lookup)
+            clause = term if clause is None else clause | term
+
+        if lead:
+            clause = q(*lead) & clause
+
+        return clause
+
+    def token_for(self, value, inclusive=True):
+        '''Returns a token for the page that starts at value, including
+        anything equal to it if inclusive (the default.)
+
+        value is the value of the leading ordering field, a sequence of
+        values for the first few, or all, of the ordering fields, or a dict
+        of them by field name, e.g. {'simple__name': 'x'}. Values are
+        converted by their fields so strings, from a date picker say, will
+        do. ValueError is raised if they aren't a prefix of the ordering and
+        InvalidPage if they can't be converted.'''
+        if isinstance(value, dict):
+            names = dict((name, name) for name in self._fields)
+            if 'pk' in names and self.queryset is not None:
+                names[self.queryset.model._meta.pk.name] = 'pk'
+            given = dict((names.get(k, k), v) for k, v in value.items())
+            values = []
+            for field in self._fields:
+                if field not in given:
+                    break
+                values.append(given.pop(field))
+            if given:
+                raise ValueError('{0} are not a prefix of the ordering {1}'
+                                 .format(', '.join(sorted(value)),
+                                         ','.join(self._orderings)))
+        elif isinstance(value, (list, tuple)):
+            values = list(value)
         else:
-            pieces = field.split('__')
-            if len(pieces) > 1:
-                # traverse relationships, -1 will be our final field
-                for piece in pieces[:-1]:
-                    # grab the ForeignKey field, then its RelatedObject, which
-                    # holds it's parent_model (the one at the other end of the
-                    # relationship) and finally its _meta which is what we're
-                    # after
-                    meta = meta.get_field(piece).related.parent_model._meta
-
-            value = meta.get_field(pieces[-1]).to_python(token)
+            values = [value]
+        if not 0 < len(values) <= len(self._fields):
+            raise ValueError('expected 1 to {0} values for the ordering {1}'
+                             .format(len(self._fields),
+                                     ','.join(self._orderings)))
+        try:
+            values = [field.to_python(v)
+                      for field, v in zip(self._key_fields, values)]
+        except ValidationError:
+            raise InvalidPage('That value is invalid')
+        return self.codec.encode(Token(values, inclusive=inclusive))
 
-        return {'{0}__{1}'.format(self._field, d): value}
+    def page_at(self, value, inclusive=True):
+        '''Returns the page that starts at value, see token_for.'''
+        return self.page(self.token_for(value, inclusive))
 
     def page(self, token=None):
         # work around generics being integer specific with a default of 1,
@@ -144,42 +438,345 @@ class PerformantPaginator(object):
         # hand
         if token == 1:
             token = None
+        elif self.checkpoints and isinstance(token, six.integer_types):
+            # a page number, jump to it
+            token = self.checkpoints.token_for_page(self, token)
+
+        record = None
+        if page_served.has_listeners():
+            record = PageRecord(token)
+            start = time()
+
+        if record:
+            with QueryCounter(connections[self.queryset.db]) as queries:
+                entry = self._entry(token, record)
+            record.queries = queries.count
+        else:
+            entry = self._entry(token)
+        object_list, previous_token, next_token = entry
 
-        # get a queryset
+        if self.prefetcher and next_token is not None:
+            # odds are they'll want it next
+            self.prefetcher.submit(self, next_token)
+
+        if record:
+            record.rows = len(object_list)
+            record.total_time = time() - start
+            page_served.send(sender=self.__class__, paginator=self,
+                             record=record)
+
+        # return our page
+        return PerformantPage(self, object_list, previous_token, token,
+                              next_token)
+
+    def _entry(self, token, record=None):
+        # from the prefetcher, the page cache, or the database
+        entry = self.prefetcher.take(self, token) \
+            if self.prefetcher else None
+        if record and self.prefetcher:
+            record.prefetched = entry is not None
+        if entry is None:
+            entry = self._cached_page(token, record)
+        return entry
+
+    def _cached_page(self, token, record=None, prefetching=False):
+        if not self.page_cache:
+            return self._page(token, record, prefetching)
+        entry = self.page_cache.get(self, token)
+        if record:
+            record.cache_hit = entry is not None
+        if entry is None:
+            entry = self._page(token, record, prefetching)
+            self.page_cache.set(self, token, *entry)
+        return entry
+
+    def _seek_queryset(self, values, backward=False, inclusive=False,
+                       pks=False, bound=None, per_page=None):
         qs = self.queryset
+        if values is not None:
+            qs = qs.filter(self._values_to_clause(values, rev=backward,
+                                                  inclusive=inclusive))
+        if bound is not None:
+            # nothing past the bound, whichever way we're going
+            qs = qs.filter(self._values_to_clause(bound, rev=True,
+                                                  inclusive=True))
+        # apply our ordering, backwards is the reverse ordering so that we can
+        # seek to our key the same as we would going forward
+        qs = qs.order_by(*(self._reverse_orderings if backward
+                           else self._orderings))
+        if pks:
+            qs = qs.values_list('pk', flat=True)
+        return qs[:(per_page or self.per_page) + 1]
+
+    def _seek(self, values, backward=False, inclusive=False, pks=False,
+              bound=None, per_page=None):
+        '''Returns a queryset of the per_page (default self.per_page) + 1
+        objects, or pks, after values, or before them if backward, from the
+        start if values is None, and no further than bound if there is
+        one.'''
+        per_page = per_page or self.per_page
+        if not self.compiled:
+            return self._seek_queryset(values, backward, inclusive, pks,
+                                       bound, per_page)
+        # one for each shape of query we run
+        shape = (None if values is None else len(values), backward, inclusive,
+                 pks, bound is not None, per_page)
+        compiled = self._compiled.get(shape)
+        if compiled is None:
+            compiled = CompiledSeek.compile(self, values, backward, inclusive,
+                                            pks, bound, per_page)
+            self._compiled[shape] = compiled
+        queryset = compiled.bind(values, bound) if compiled else None
+        if queryset is None:
+            # it couldn't be, or these values can't be, use the orm
+            return self._seek_queryset(values, backward, inclusive, pks,
+                                       bound, per_page)
+        return queryset
+
+    def _page(self, token, record=None, prefetching=False):
+        '''Returns the object list, previous, and next tokens for token. If
+        there's a record where the time goes is noted in it. prefetching is
+        True when it's being fetched ahead of time by the prefetcher.'''
+        values = bound = size = None
+        backward = inclusive = False
         # if we have a truthy token, not includeing '', we'll need to offset
         if token:
             # we're paged in a bit, token will be the values of the final
-            # object of the previous page, so we'll start with it
-            qs = qs.filter(**self._token_to_clause(token))
-
-        # apply our ordering
-        qs = qs.order_by(self.ordering)
+            # object of the previous page, so we'll start with it, or if we're
+            # going backwards the first object of the following page and we'll
+            # walk back from it
+            if record:
+                start = time()
+            decoded = self._decode_token(token)
+            if record:
+                record.decode_time = time() - start
+            values = decoded.values
+            backward = decoded.backward
+            inclusive = decoded.inclusive
+            bound = decoded.bound
+            # only adaptive paginators size their pages by the token
+            size = decoded.size if self.adaptive else None
 
         # get our object list, +1 to see if there's more to come
-        object_list = list(qs[:self.per_page + 1])
-
-        next_token = None
-        # if there were more, then use
-        if len(object_list) > self.per_page:
-            # get rid of the extra
-            object_list = object_list[:-1]
-            # and now our last item's pk is the token for the next page
-            next_token = self._object_to_token(object_list[-1])
-
-        previous_token = None
-        # if we have a truthy token, not including '', we'll check to see if
-        # there's a prev
-        if token:
-            clause = self._token_to_clause(token, rev=True)
-            qs = self.queryset.filter(**clause).only(self._field) \
-                .order_by(self._reverse_ordering)
+        if record:
+            start = time()
+        if bound is None and self.snapshot:
+            # starting a walk, pin it to what's there now
+            bound = self._high_water_mark()
+        per_page = self.per_page
+        if self.adaptive:
+            # the token's size, whatever it says, is kept to the adaptive's
+            per_page = self.adaptive.initial(self.per_page) if size is None \
+                else self.adaptive.clamp(size)
+            fetching = time()
+        object_list = None
+        if self.late_lookup:
+            # the keys first and then the objects for them, in the same order
+            pks = list(self._seek(values, backward, inclusive, pks=True,
+                                  bound=bound, per_page=per_page))
+            objects = self.queryset.in_bulk(pks[:per_page])
+            if len(objects) == len(pks[:per_page]):
+                object_list = [objects[pk] for pk in pks[:per_page]]
+                more = len(pks) > per_page
+            # else something was deleted in between, start over the usual way
+        if object_list is None:
+            object_list = list(self._seek(values, backward, inclusive,
+                                          bound=bound, per_page=per_page))
+            more = len(object_list) > per_page
+            if more:
+                # get rid of the extra
+                object_list = object_list[:-1]
+        if record or self.adaptive:
+            fetched = time()
+        if record:
+            record.query_time = fetched - start
+        if self.adaptive:
+            # what the page after this one should be, from how this one went.
+            # prefetches contend with the pages being served, so they aren't
+            # learnt from
+            size = self.adaptive.next_size(per_page, object_list,
+                                           fetched - fetching,
+                                           learn=not prefetching)
+        if record:
+            start = time()
+
+        if backward:
+            # put things back in the expected order
+            object_list.reverse()
+            # we came from the page after this one so there's always a next,
+            # if there's nothing at all before the token it's the first page
+            # and can't be none b/c some tooling will turn it in to 'None'
+            next_token = self._object_to_token(object_list[-1], False, bound,
+                                               size) if object_list else ''
+            # if there were more, walk back from our first item
+            previous_token = self._object_to_token(object_list[0], True,
+                                                   bound, size) \
+                if more else None
+        else:
+            # if there were more, our last item's key is the token for the next
+            # page
+            next_token = self._object_to_token(object_list[-1], False, bound,
+                                               size) if more else None
+            previous_token = None
+            # if we have a truthy token, not including '', there are things
+            # before us and we'll walk back from our first item or the token
+            # itself when we've run off the end
+            if object_list and token:
+                previous_token = self._object_to_token(object_list[0], True,
+                                                       bound, size)
+            elif token:
+                previous_token = self.codec.encode(Token(decoded.values, True,
+                                                         bound=bound,
+                                                         size=size))
+
+        if record:
+            record.encode_time = time() - start
+
+        return object_list, previous_token, next_token
+
+    def iter_batches(self, batch_size=None):
+        '''Walks the whole queryset, in order, yielding lists of at most
+        batch_size (default per_page) objects.
+
+        This is intended for jobs that need to visit everything. Rather than
+        building pages and tokens the key of the final object in each batch is
+        held on to and used to seek to the next. With snapshot the walk stops
+        at what was the final object when it started.'''
+        batch_size = int(batch_size or self.per_page)
+        qs = self.queryset.order_by(*self._orderings)
+        if self.snapshot:
+            bound = self._high_water_mark()
+            if bound is None:
+                return
+            qs = qs.filter(self._values_to_clause(bound, rev=True,
+                                                  inclusive=True))
+        values = None
+        while True:
+            batch_qs = qs
+            if values is not None:
+                batch_qs = qs.filter(self._values_to_clause(values))
+            batch = list(batch_qs[:batch_size])
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                # a short (or empty) batch means we've run out
+                return
+            values = self._object_to_values(batch[-1])
+
+    def iter_objects(self, batch_size=None):
+        '''Walks the whole queryset, in order, yielding objects one at a time.
+        They're fetched batch_size (default per_page) at a time so memory use
+        stays flat regardless of the size of the queryset.'''
+        for batch in self.iter_batches(batch_size):
+            for obj in batch:
+                yield obj
+
+    def follow(self, token=None, **kwargs):
+        '''Returns a Follower, see performant_pagination.follow, that yields
+        lists of the rows past token, from the start if there isn't one, as
+        they show up, e.g.
+
+            for rows in paginator.follow(last_token, max_interval=10):
+                ...
+
+        It costs a query per list and, when there's nothing new, a query
+        every so often, backing off to one every max_interval seconds.'''
+        return Follower(self, token, **kwargs)
+
+    def partitions(self, n):
+        '''Splits the queryset in to at most n contiguous ranges of the leading
+        ordering field and returns a paginator, with the same settings, for
+        each of them in order.
+
+        Numeric, date, and datetime fields are split evenly between their min
+        and max, which are a pair of cheap index seeks. Anything else is split
+        at sampled quantiles, which will cost a count and an offset query per
+        boundary, but only the once.'''
+        field, descending = self._keys[0]
+        if field == 'pk':
+            field = self.queryset.model._meta.pk.name
+        qs = self.queryset
+        bounds = qs.aggregate(low=Min(field), high=Max(field))
+        low, high = bounds['low'], bounds['high']
+        if low is None:
+            # nothing to partition
+            return []
+
+        boundaries = []
+        if n > 1 and low != high:
+            try:
+                if isinstance(low, six.integer_types):
+                    step = max((high - low) // n, 1)
+                else:
+                    step = (high - low) / n
+                boundaries = [low + step * i for i in range(1, n)]
+            except TypeError:
+                # not something we can do arithmetic on, sample instead
+                total = qs.count()
+                values = qs.order_by(field).values_list(field, flat=True)
+                try:
+                    boundaries = [values[total * i // n] for i in range(1, n)]
+                except IndexError:
+                    # things were deleted out from under us, make do
+                    pass
+            # drop duplicates and anything that would leave a range empty
+            boundaries = sorted(b for b in set(boundaries) if low < b <= high)
+
+        gte = '{0}__gte'.format(field)
+        lt = '{0}__lt'.format(field)
+        querysets = []
+        for i in range(len(boundaries) + 1):
+            clause = {}
+            if i > 0:
+                clause[gte] = boundaries[i - 1]
+            if i < len(boundaries):
+                clause[lt] = boundaries[i]
+            querysets.append(qs.filter(**clause))
+        if descending:
+            # partitions go in the order we'd walk them
+            querysets.reverse()
+
+        paginators = []
+        for queryset in querysets:
+            paginator = copy(self)
+            paginator.queryset = queryset
+            # anything compiled was for our queryset
+            paginator._compiled = {}
+            paginator._fingerprint = None
+            paginators.append(paginator)
+        return paginators
+
+    def map(self, func, workers=4, partitions=None, batch_size=None):
+        '''Calls func with each batch of objects, see iter_batches, returning
+        a list of the results in order.
+
+        The queryset is split in to partitions (default workers) ranges, see
+        partitions, which are walked concurrently by a pool of workers
+        threads. Each thread has its own database connection so at most
+        workers will be in use at a time. With workers=1 everything is done
+        in the calling thread.'''
+        paginators = self.partitions(partitions or workers)
+
+        def walk(paginator):
+            return [func(batch) for batch in
+                    paginator.iter_batches(batch_size)]
+
+        if workers <= 1:
+            results = [walk(paginator) for paginator in paginators]
+        else:
+            def threaded_walk(paginator):
+                try:
+                    return walk(paginator)
+                finally:
+                    # the connection belongs to the pool's thread, don't leak
+                    # it once we're done with it
+                    connections[paginator.queryset.db].close()
+
+            pool = ThreadPool(workers)
             try:
-                previous_token = self._object_to_token(qs[self.per_page - 1])
-            except IndexError:
-                # can't be none b/c some tooling will turn it in to 'None'
-                previous_token = ''
+                results = pool.map(threaded_walk, paginators)
+            finally:
+                pool.close()
+                pool.join()
 
-        # return our page
-        return PerformantPage(self, object_list, previous_token, token,
-                              next_token)
+        return [result for partition in results for result in partition]
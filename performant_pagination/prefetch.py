@@ -0,0 +1,104 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import OrderedDict
+from django.db import connections
+from multiprocessing.pool import ThreadPool
+from performant_pagination.caching import codec_fingerprint
+from threading import Lock
+from time import time
+
+
+def _close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+class Prefetcher(object):
+    '''Speculatively fetches the next page in the background as each page is
+    served so that a following page(next_token) can be handed straight back.
+    Sequential walkers, sync jobs, infinite scroll, etc. will then only wait
+    on the database when they get ahead of it.
+
+    Up to size fetched pages are held on to, the oldest are thrown away when
+    there are more, as are any that haven't been asked for within timeout
+    seconds. Prefetched pages reflect the data as it was when they were
+    fetched, which will be a little before they're asked for.
+
+    Pages are keyed by the paginator's queryset, ordering, per_page and codec
+    as well as the token, so a Prefetcher can be shared by paginators, one per
+    request for instance, without one being handed another's pages.
+
+    Fetches are done in a single background thread, with its own database
+    connection, unless a pool, anything with apply_async, is provided. close
+    shuts the thread, and its connection, down.'''
+
+    def __init__(self, size=2, pool=None, timeout=30):
+        self.size = size
+        self.timeout = timeout
+        self._pool = pool
+        self._owns_pool = pool is None
+        # key -> (expires, AsyncResult), oldest first
+        self._pending = OrderedDict()
+        self._lock = Lock()
+
+    def _key(self, paginator, token):
+        return (paginator._queryset_fingerprint(),
+                tuple(paginator._orderings), paginator.per_page,
+                codec_fingerprint(paginator.codec), token)
+
+    def _expire(self):
+        now = time()
+        while self._pending:
+            key, (expires, _) = next(iter(self._pending.items()))
+            if expires > now:
+                break
+            del self._pending[key]
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPool(1)
+        return self._pool
+
+    def submit(self, paginator, token):
+        '''Starts fetching paginator's token page in the background.'''
+        key = self._key(paginator, token)
+        with self._lock:
+            self._expire()
+            if key in self._pending:
+                return
+            self._pending[key] = (time() + self.timeout, self._get_pool()
+                                  .apply_async(paginator._cached_page,
+                                               (token, None, True)))
+            while len(self._pending) > self.size:
+                self._pending.popitem(last=False)
+
+    def take(self, paginator, token):
+        '''Returns the object list, previous, and next tokens for paginator's
+        token page if it's been prefetched, waiting on it if it's still in
+        flight, or None if it hasn't.'''
+        key = self._key(paginator, token)
+        with self._lock:
+            self._expire()
+            entry = self._pending.pop(key, None)
+        if entry is None:
+            return None
+        try:
+            return entry[1].get()
+        except Exception:
+            # whatever it was will happen again, and be raised, when the page
+            # is fetched for real
+            return None
+
+    def close(self):
+        with self._lock:
+            self._pending.clear()
+        if self._owns_pool and self._pool is not None:
+            # the pool's thread has its own connection that only it can close
+            self._pool.apply(_close_connections)
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""
+Benchmarks PerformantPaginator against Django's Paginator on SQLite tables of
+various sizes at shallow and deep pages. Results are written as JSON for
+regression tracking, with a summary on stderr.
+
+    python performant_pagination/runtests/benchmark.py --sizes=10000,100000
+"""
+
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import os
+import sys
+
+# fix sys path so we don't need to setup PYTHONPATH
+sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
+os.environ['DJANGO_SETTINGS_MODULE'] = \
+    'performant_pagination.runtests.settings'
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import six
+from tempfile import mkstemp
+from time import time
+import json
+import platform
+
+import django
+
+
+def seed(size, batch_size=5000):
+    from performant_pagination.tests.models import RelatedModel, \
+        SimpleModel, TimedModel
+
+    def bulk(model, objs):
+        for i in range(0, len(objs), batch_size):
+            model.objects.bulk_create(objs[i:i + batch_size])
+
+    for model in (RelatedModel, SimpleModel, TimedModel):
+        model.objects.all().delete()
+
+    with transaction.atomic():
+        # names repeat so that ordering by them needs the pk tie-breaker
+        bulk(SimpleModel, [SimpleModel(name='object {0:08d}'.format(i % 997))
+                           for i in range(size)])
+        pks = list(SimpleModel.objects.values_list('pk', flat=True)[:1000])
+        bulk(RelatedModel, [RelatedModel(number=i,
+                                         simple_id=pks[i % len(pks)])
+                            for i in range(size)])
+        # when_date is unique, which caps how many of these there can be
+        base = datetime(9000, 1, 1)
+        bulk(TimedModel, [TimedModel(when_datetime=when, when_date=when,
+                                     when_time=when)
+                          for when in (base - timedelta(days=i, seconds=i,
+                                                        microseconds=i)
+                                       for i in range(min(size, 2500000)))])
+    cursor = connection.cursor()
+    cursor.execute('ANALYZE')
+    cursor.close()
+
+
+def scenarios():
+    from performant_pagination.tests.models import RelatedModel, \
+        SimpleModel, TimedModel
+    return (
+        ('simple-pk', SimpleModel.objects.all(), 'pk'),
+        ('simple-name', SimpleModel.objects.all(), ('name', 'pk')),
+        ('related-name', RelatedModel.objects.all(), ('simple__name', 'pk')),
+        ('timed-datetime', TimedModel.objects.all(), '-when_datetime'),
+    )
+
+
+def percentile(timings, p):
+    timings = sorted(timings)
+    return timings[min(int(len(timings) * p / 100), len(timings) - 1)]
+
+
+def explain(queryset):
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    plan = [row[-1] for row in cursor.fetchall()]
+    cursor.close()
+    return plan
+
+
+def measure(fetch, repeats):
+    # once to warm things up and see what it does
+    with CaptureQueriesContext(connection) as queries:
+        rows = len(fetch())
+    timings = []
+    for _ in range(repeats):
+        start = time()
+        fetch()
+        timings.append((time() - start) * 1000)
+    return {
+        'rows': rows,
+        'queries': len(queries.captured_queries),
+        'p50_ms': percentile(timings, 50),
+        'p90_ms': percentile(timings, 90),
+        'p99_ms': percentile(timings, 99),
+        'max_ms': max(timings),
+    }
+
+
+def benchmark(size, per_page, depths, repeats):
+    from performant_pagination.pagination import PerformantPaginator
+
+    results = []
+    for name, queryset, ordering in scenarios():
+        orderings = (ordering,) \
+            if isinstance(ordering, six.string_types) else ordering
+        ordered = queryset.order_by(*orderings)
+        total = ordered.count()
+        last = max((total + per_page - 1) // per_page, 1)
+        for depth in sorted(set(last if d == 'last' else int(d)
+                                for d in depths)):
+            if depth > last:
+                continue
+            offset = (depth - 1) * per_page
+
+            performant = PerformantPaginator(queryset, per_page=per_page,
+                                             ordering=ordering)
+            compiled = PerformantPaginator(queryset, per_page=per_page,
+                                           ordering=ordering, compiled=True)
+            token = None
+            keyset = performant.queryset.order_by(*performant._orderings)
+            if offset:
+                # the token we'd have been handed by the previous page
+                previous = performant.queryset \
+                    .order_by(*performant._orderings)[offset - 1]
+                token = performant._object_to_token(previous)
+                keyset = keyset.filter(performant._values_to_clause(
+                    performant._object_to_values(previous)))
+
+            for kind, fetch, plan in (
+                ('performant', lambda: list(performant.page(token)),
+                 explain(keyset[:per_page + 1])),
+                ('compiled', lambda: list(compiled.page(token)),
+                 explain(keyset[:per_page + 1])),
+                # a new Paginator each time, it'd otherwise remember its count
+                ('django', lambda: list(Paginator(ordered, per_page)
+                                        .page(depth)),
+                 explain(ordered[offset:offset + per_page])),
+            ):
+                result = measure(fetch, repeats)
+                result.update({
+                    'scenario': name,
+                    'size': size,
+                    'total': total,
+                    'per_page': per_page,
+                    'page': depth,
+                    'paginator': kind,
+                    'plan': plan,
+                })
+                results.append(result)
+                print('{scenario:>15} {total:>9} {page:>7} {paginator:>10} '
+                      '{queries} queries p50 {p50_ms:8.3f}ms '
+                      'p99 {p99_ms:8.3f}ms'.format(**result), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', default='10000,100000',
+                        help='comma separated table sizes, up to 10000000')
+    parser.add_argument('--per-page', type=int, default=25)
+    parser.add_argument('--depths', default='1,10,100,1000,last',
+                        help='comma separated page numbers, or last')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--database', default=None,
+                        help='sqlite file to use, default a temporary one')
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON results to, default '
+                        'stdout')
+    args = parser.parse_args()
+
+    database = args.database
+    if database is None:
+        fd, database = mkstemp(suffix='.db')
+        os.close(fd)
+    settings.DATABASES['default']['NAME'] = database
+    if hasattr(django, 'setup'):
+        django.setup()
+
+    try:
+        call_command('syncdb', interactive=False, verbosity=0)
+        results = []
+        for size in (int(s) for s in args.sizes.split(',')):
+            print('seeding {0} rows'.format(size), file=sys.stderr)
+            seed(size)
+            results.extend(benchmark(size, args.per_page,
+                                     args.depths.split(','), args.repeats))
+    finally:
+        if args.database is None:
+            os.unlink(database)
+
+    report = {
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'sqlite': connection.Database.sqlite_version,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
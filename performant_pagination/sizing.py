@@ -0,0 +1,117 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.utils import six
+from threading import Lock
+
+
+def row_bytes(row):
+    '''A rough measure of the size of row, an object, dict, tuple, or flat
+    value, once serialized, the total length of its values as text.'''
+    if isinstance(row, dict):
+        values = row.values()
+    elif isinstance(row, (list, tuple)):
+        values = row
+    elif hasattr(row, '__dict__'):
+        # fields, skipping _state, cached relationships, etc.
+        values = [v for k, v in row.__dict__.items() if not k.startswith('_')]
+    else:
+        values = [row]
+    return sum(len(six.text_type(value)) for value in values)
+
+
+class AdaptivePageSize(object):
+    '''Picks each page's size, from min_size to max_size, so that its query
+    takes about target_time seconds and/or its rows come to about
+    target_bytes, as measured by measure (default row_bytes.) With both the
+    smaller of the two wins.
+
+    The size for a page is worked out from the page before it, the time per
+    row its query took and the size of its rows, and carried in its tokens,
+    so a walk keeps to what's been seen along the way whichever process
+    serves it. It can at most double from one page to the next. The first
+    page of a walk goes by a running average of recent pages, or per_page
+    until there are some.
+
+    Sizes are kept to min_size doubled some number of times, and max_size,
+    so that there are only a handful of distinct queries, which matters to
+    compiled paginators and the database's statement cache.
+
+    It's thread-safe, and can be shared by paginators.'''
+
+    def __init__(self, target_time=None, target_bytes=None, min_size=10,
+                 max_size=1000, measure=None, smoothing=0.3):
+        if not target_time and not target_bytes:
+            raise ValueError('a target_time and/or target_bytes is required')
+        if min_size < 1 or max_size < min_size:
+            raise ValueError('min_size must be at least 1 and no more than '
+                             'max_size')
+        self.target_time = target_time
+        self.target_bytes = target_bytes
+        self.min_size = min_size
+        self.max_size = max_size
+        self.measure = measure or row_bytes
+        self.smoothing = smoothing
+        self.sizes = []
+        size = min_size
+        while size < max_size:
+            self.sizes.append(size)
+            size *= 2
+        self.sizes.append(max_size)
+        # running averages, per row, of recent pages
+        self._row_time = self._row_bytes = None
+        self._lock = Lock()
+
+    def __repr__(self):
+        return '<AdaptivePageSize (%s, %s, %d, %d)>' % (self.target_time,
+                                                        self.target_bytes,
+                                                        self.min_size,
+                                                        self.max_size)
+
+    def clamp(self, size):
+        '''The largest of our sizes that's no more than size, min_size if
+        there isn't one.'''
+        fits = [s for s in self.sizes if s <= size]
+        return fits[-1] if fits else self.min_size
+
+    def _estimate(self, row_time, row_bytes):
+        sizes = []
+        if self.target_time and row_time:
+            sizes.append(self.target_time / row_time)
+        if self.target_bytes and row_bytes:
+            sizes.append(self.target_bytes / row_bytes)
+        return int(min(sizes)) if sizes else None
+
+    def _smooth(self, average, value):
+        if value is None or average is None:
+            return value if average is None else average
+        return average + self.smoothing * (value - average)
+
+    def initial(self, per_page):
+        '''The size of the first page of a walk.'''
+        with self._lock:
+            size = self._estimate(self._row_time, self._row_bytes)
+        return self.clamp(per_page if size is None else size)
+
+    def next_size(self, size, rows, elapsed, learn=True):
+        '''The size of the page after one of size whose query took elapsed
+        seconds and returned rows. Unless learn is False it's also added to
+        the running averages that first pages go by.'''
+        if not rows:
+            return size
+        row_time = float(elapsed) / len(rows)
+        row_bytes = None
+        if self.target_bytes:
+            row_bytes = float(sum(self.measure(row) for row in rows)) / \
+                len(rows)
+        if learn:
+            with self._lock:
+                self._row_time = self._smooth(self._row_time, row_time)
+                self._row_bytes = self._smooth(self._row_bytes, row_bytes)
+        estimate = self._estimate(row_time, row_bytes)
+        if estimate is None:
+            return size
+        return self.clamp(min(estimate, size * 2))
@@ -0,0 +1,152 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+from performant_pagination import advisor
+from performant_pagination.advisor import IndexWarning, advise
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import RelatedModel, SimpleModel
+import warnings
+
+
+class TestAdvisor(TestCase):
+
+    def setUp(self):
+        simple = SimpleModel.objects.create(name='simple')
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(simple=simple, number=i) for i in range(10)]
+        )
+        self.simple = simple
+
+    def test_indexed(self):
+        advice = advise(PerformantPaginator(SimpleModel.objects.all()))
+        self.assertEquals([], advice.problems)
+        self.assertEquals(None, advice.index)
+        self.assertEquals(set(('first', 'forward', 'reverse')),
+                          set(advice.plans.keys()))
+        self.assertEquals('ok', '{0}'.format(advice))
+
+        # name's index has the pk, rowid, on the end
+        advice = advise(PerformantPaginator(SimpleModel.objects.all(),
+                                            ordering=('-name',)))
+        self.assertEquals([], advice.problems)
+
+    def test_unindexed(self):
+        advice = advise(PerformantPaginator(RelatedModel.objects.all(),
+                                            ordering=('number',)))
+        self.assertTrue(advice.problems)
+        self.assertTrue(any(p.startswith('sort')
+                            for _, p in advice.problems))
+        self.assertEquals('CREATE INDEX tests_relatedmodel_number_id_pp ON '
+                          'tests_relatedmodel (number, id);', advice.index)
+
+        advice = advise(PerformantPaginator(RelatedModel.objects.all(),
+                                            ordering=('number', '-pk')))
+        self.assertEquals('CREATE INDEX tests_relatedmodel_number_id_pp ON '
+                          'tests_relatedmodel (number, id DESC);',
+                          advice.index)
+
+    def test_filtered(self):
+        # the unique_together index covers this one
+        qs = RelatedModel.objects.filter(simple=self.simple)
+        advice = advise(PerformantPaginator(qs, ordering=('number',)))
+        self.assertEquals([], advice.problems)
+
+        # but not this, and the filter goes first in the index
+        qs = RelatedModel.objects.filter(simple=self.simple, number__gt=2)
+        advice = advise(PerformantPaginator(qs, ordering=('-pk',)))
+        self.assertTrue(advice.problems)
+        self.assertEquals('CREATE INDEX tests_relatedmodel_simple_id_id_pp '
+                          'ON tests_relatedmodel (simple_id, id);',
+                          advice.index)
+
+    def test_related(self):
+        advice = advise(PerformantPaginator(RelatedModel.objects.all(),
+                                            ordering=('simple__name',)))
+        self.assertTrue(advice.problems)
+        # nothing on our table can help
+        self.assertEquals(None, advice.index)
+
+    def test_empty(self):
+        RelatedModel.objects.all().delete()
+        advice = advise(PerformantPaginator(RelatedModel.objects.all(),
+                                            ordering=('number',)))
+        # without a token there's only the first page to look at
+        self.assertEquals(['first'], list(advice.plans.keys()))
+        self.assertTrue(advice.problems)
+
+        # and nothing at all when there's no query to run
+        for qs in (RelatedModel.objects.none(),
+                   RelatedModel.objects.filter(pk__in=[])):
+            advice = advise(PerformantPaginator(qs, ordering=('number',)))
+            self.assertEquals({}, advice.plans)
+            self.assertEquals([], advice.problems)
+
+    def test_warning(self):
+        advisor._checked.clear()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            PerformantPaginator(RelatedModel.objects.all(),
+                                ordering=('number',))
+            # off by default
+            self.assertEquals([], caught)
+
+            with override_settings(PERFORMANT_PAGINATION_CHECK_INDEXES=True):
+                with self.settings(DEBUG=False):
+                    PerformantPaginator(RelatedModel.objects.all(),
+                                        ordering=('number',))
+                    self.assertEquals([], caught)
+                with self.settings(DEBUG=True):
+                    PerformantPaginator(SimpleModel.objects.all())
+                    self.assertEquals([], caught)
+                    PerformantPaginator(RelatedModel.objects.all(),
+                                        ordering=('number',))
+                    self.assertEquals(1, len(caught))
+                    self.assertEquals(IndexWarning, caught[0].category)
+                    self.assertTrue('tests.RelatedModel ordered by number,pk'
+                                    in '{0}'.format(caught[0].message))
+                    # only the once
+                    PerformantPaginator(RelatedModel.objects.all(),
+                                        ordering=('number',))
+                    self.assertEquals(1, len(caught))
+
+                    # whatever the params
+                    checked = len(advisor._checked)
+                    for number in range(3):
+                        PerformantPaginator(
+                            RelatedModel.objects.filter(number__gt=number),
+                            ordering=('number',))
+                    self.assertEquals(2, len(caught))
+                    self.assertEquals(checked + 1, len(advisor._checked))
+
+                    # or when there's no query to check
+                    PerformantPaginator(RelatedModel.objects.none(),
+                                        ordering=('number',))
+                    self.assertEquals(2, len(caught))
+
+    def test_command(self):
+        out = StringIO()
+        call_command('check_pagination_indexes', 'tests.SimpleModel',
+                     ordering='name', stdout=out)
+        self.assertEquals('ok', out.getvalue().strip())
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_pagination_indexes', 'tests.RelatedModel',
+                         'number__gt=2', ordering='number,pk', stdout=out)
+        self.assertTrue('CREATE INDEX tests_relatedmodel_number_id_pp'
+                        in out.getvalue())
+
+        for model in ('tests.Nope', 'nope.SimpleModel'):
+            with self.assertRaises(CommandError):
+                call_command('check_pagination_indexes', model)
+        with self.assertRaises(CommandError):
+            call_command('check_pagination_indexes', 'tests.SimpleModel',
+                         'name')
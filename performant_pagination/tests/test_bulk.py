@@ -0,0 +1,103 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db.models import F
+from django.test import TestCase
+from performant_pagination import bulk
+from performant_pagination.bulk import batched_delete, batched_update
+from performant_pagination.tests.models import RelatedModel, SimpleModel
+
+
+class TestBulk(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 9)) for i in range(47)]
+        )
+
+    def test_update(self):
+        qs = SimpleModel.objects.filter(name__lt='object 5')
+        expected = qs.count()
+        totals = []
+        # a seek and an update for each batch, the final one short, and as
+        # we're in the test's transaction a savepoint and its release for each
+        with self.assertNumQueries(3 * 4):
+            updated = batched_update(qs, batch_size=10,
+                                     progress=totals.append, name='updated')
+        self.assertEquals(expected, updated)
+        self.assertEquals(27, expected)
+        self.assertEquals([10, 20, 27], totals)
+        self.assertEquals(expected,
+                          SimpleModel.objects.filter(name='updated').count())
+        self.assertEquals(47 - expected,
+                          SimpleModel.objects.exclude(name='updated').count())
+
+    def test_ordering(self):
+        names = list(SimpleModel.objects.order_by('pk')
+                     .values_list('name', flat=True))
+        n = batched_update(SimpleModel.objects.all(), ordering='-pk',
+                           batch_size=7, name='x')
+        self.assertEquals(47, n)
+        self.assertEquals(47, SimpleModel.objects.filter(name='x').count())
+        for ordering in (('name',), ('-name', 'pk')):
+            n = batched_delete(SimpleModel.objects.filter(name='x'),
+                               ordering=ordering, batch_size=7)
+            self.assertEquals(47, n)
+            SimpleModel.objects.bulk_create(
+                [SimpleModel(name='x') for _ in names]
+            )
+
+        with self.assertRaises(ValueError):
+            batched_update(SimpleModel.objects.all(), ordering=('name',),
+                           name='x')
+        with self.assertRaises(ValueError):
+            batched_update(SimpleModel.objects.all(), id=1)
+        with self.assertRaises(ValueError):
+            batched_update(SimpleModel.objects.all(), batch_size=0)
+
+    def test_related(self):
+        simple = list(SimpleModel.objects.all()[:5])
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(simple=simple[i % 5], number=i) for i in range(30)]
+        )
+        n = batched_update(RelatedModel.objects.filter(number__gte=10),
+                           ordering=('simple__name', 'pk'), batch_size=4,
+                           number=F('number') + 100)
+        self.assertEquals(20, n)
+        self.assertEquals(list(range(10)) + list(range(110, 130)),
+                          sorted(RelatedModel.objects
+                                 .values_list('number', flat=True)))
+        for changes in ({'simple': simple[0]}, {'simple_id': 1}):
+            with self.assertRaises(ValueError):
+                batched_update(RelatedModel.objects.all(),
+                               ordering=('simple__name',), **changes)
+
+    def test_delete(self):
+        qs = SimpleModel.objects.filter(name='object 3')
+        expected = qs.count()
+        self.assertEquals(expected, batched_delete(qs, ordering='-pk',
+                                                   batch_size=2))
+        self.assertFalse(qs.exists())
+        self.assertEquals(47 - expected, SimpleModel.objects.count())
+        self.assertEquals(0, batched_delete(qs))
+
+    def test_target_time(self):
+        sizes = []
+
+        def apply(batch, n):
+            sizes.append(n)
+            return batch.update(name='x')
+
+        # every batch takes the same time, whatever its size, so they'll
+        # grow, doubling at most, up to the max
+        times = iter(range(1000))
+        bulk.time, time = lambda: next(times), bulk.time
+        try:
+            bulk._batched(SimpleModel.objects.all(), 'pk', 2, 10, 16, 0,
+                          None, apply)
+        finally:
+            bulk.time = time
+        self.assertEquals([2, 4, 8, 16, 16, 1], sizes)
@@ -0,0 +1,340 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.cache import get_cache
+from django.test import TestCase
+from performant_pagination import caching, pagination
+from performant_pagination.caching import CountCache, LRUCache, \
+    ModelVersions, PageCache, queryset_fingerprint
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import SimpleModel
+import gc
+import weakref
+
+
+class CachingTestCase(TestCase):
+
+    def setUp(self):
+        get_cache('default').clear()
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i)) for i in range(53)]
+        )
+
+    def travel(self, seconds):
+        # move the cache's clock forward
+        now = caching.time()
+        caching.time = lambda: now + seconds
+
+    def tearDown(self):
+        caching.time = time
+
+
+class TestFingerprint(CachingTestCase):
+
+    def test_fingerprint(self):
+        qs = SimpleModel.objects.all()
+        self.assertEquals(queryset_fingerprint(qs),
+                          queryset_fingerprint(SimpleModel.objects.all()))
+        self.assertEquals(queryset_fingerprint(qs.filter(name='a')),
+                          queryset_fingerprint(qs.filter(name='a')))
+        self.assertNotEquals(queryset_fingerprint(qs),
+                             queryset_fingerprint(qs.filter(name='a')))
+        self.assertNotEquals(queryset_fingerprint(qs.filter(name='a')),
+                             queryset_fingerprint(qs.filter(name='b')))
+
+    def test_empty(self):
+        # there's no SQL for querysets that can't match anything
+        qs = SimpleModel.objects.all()
+        self.assertEquals(queryset_fingerprint(qs.none()),
+                          queryset_fingerprint(qs.filter(pk__in=[])))
+        self.assertNotEquals(queryset_fingerprint(qs),
+                             queryset_fingerprint(qs.none()))
+
+
+class TestCountCache(CachingTestCase):
+
+    def test_paginator(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        allow_count=True,
+                                        count_cache=CountCache())
+        with self.assertNumQueries(1):
+            self.assertEquals(53, paginator.count())
+        # every other page, and paginator, gets it for free
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        allow_count=True,
+                                        count_cache=CountCache())
+        with self.assertNumQueries(0):
+            self.assertEquals(53, paginator.count())
+        self.assertTrue(paginator.count_is_exact)
+
+        # different querysets are counted separately
+        paginator = PerformantPaginator(
+            SimpleModel.objects.filter(name='object 1'), allow_count=True,
+            count_cache=CountCache())
+        self.assertEquals(1, paginator.count())
+
+    def test_invalidation(self):
+        qs = SimpleModel.objects.all()
+        cache = CountCache()
+        self.assertEquals(53, cache.count(qs))
+
+        # saving invalidates
+        obj = SimpleModel.objects.create(name='another')
+        with self.assertNumQueries(1):
+            self.assertEquals(54, cache.count(qs))
+        with self.assertNumQueries(0):
+            self.assertEquals(54, cache.count(qs))
+
+        # as does deleting
+        obj.delete()
+        self.assertEquals(53, cache.count(qs))
+
+        # unless we've asked it not to
+        cache = CountCache(invalidate=False, prefix='other')
+        self.assertEquals(53, cache.count(qs))
+        SimpleModel.objects.create(name='another')
+        self.assertEquals(53, cache.count(qs))
+
+    def test_empty(self):
+        cache = CountCache()
+        for qs in (SimpleModel.objects.none(),
+                   SimpleModel.objects.filter(pk__in=[])):
+            with self.assertNumQueries(0):
+                self.assertEquals(0, cache.count(qs))
+
+    def test_independent_versions(self):
+        qs = SimpleModel.objects.all()
+        # something else, with its own cache, is watching the same model
+        versions = ModelVersions(LRUCache(), 'performant_pagination')
+        before = versions.get(SimpleModel)
+        cache = CountCache()
+        self.assertEquals(53, cache.count(qs))
+
+        # both of them hear about the save
+        SimpleModel.objects.create(name='another')
+        self.assertNotEquals(before, versions.get(SimpleModel))
+        self.assertEquals(54, cache.count(qs))
+
+        # and the signals don't keep them alive
+        ref = weakref.ref(cache)
+        del cache
+        gc.collect()
+        self.assertEquals(None, ref())
+
+    def test_timeout(self):
+        qs = SimpleModel.objects.all()
+        cache = CountCache(timeout=60)
+        self.assertEquals(53, cache.count(qs))
+        # bulk_create doesn't invalidate
+        SimpleModel.objects.bulk_create([SimpleModel(name='another')])
+
+        self.travel(30)
+        with self.assertNumQueries(0):
+            self.assertEquals(53, cache.count(qs))
+
+        # expired, the locmem cache has its own clock so the entry's still
+        # there, but we won't use it
+        self.travel(61)
+        with self.assertNumQueries(1):
+            self.assertEquals(54, cache.count(qs))
+
+    def test_stale_while_revalidate(self):
+        qs = SimpleModel.objects.all()
+        cache = CountCache(timeout=60, stale_timeout=60)
+        self.assertEquals(53, cache.count(qs))
+        SimpleModel.objects.bulk_create([SimpleModel(name='another')])
+        self.travel(90)
+
+        # someone else is recounting, we get the stale count
+        key = cache._key(qs)
+        cache.cache.add(key + ':lock', 1)
+        with self.assertNumQueries(0):
+            self.assertEquals(53, cache.count(qs))
+
+        # they're done, we're first to see it stale so we recount
+        cache.cache.delete(key + ':lock')
+        with self.assertNumQueries(1):
+            self.assertEquals(54, cache.count(qs))
+        # and have let go of the lock
+        self.assertEquals(None, cache.cache.get(key + ':lock'))
+
+
+class TestLRUCache(CachingTestCase):
+
+    def test_basics(self):
+        cache = LRUCache()
+        self.assertEquals(None, cache.get('a'))
+        self.assertEquals(42, cache.get('a', 42))
+        cache.set('a', [1, 2])
+        self.assertEquals([1, 2], cache.get('a'))
+        # values are copies
+        cache.get('a').append(3)
+        self.assertEquals([1, 2], cache.get('a'))
+
+        self.assertFalse(cache.add('a', 'x'))
+        self.assertTrue(cache.add('b', 'x'))
+        self.assertEquals('x', cache.get('b'))
+
+        cache.delete('a')
+        self.assertEquals(None, cache.get('a'))
+        cache.clear()
+        self.assertEquals(None, cache.get('b'))
+        self.assertEquals(0, cache.size)
+
+    def test_timeout(self):
+        cache = LRUCache()
+        cache.set('a', 1, 10)
+        cache.set('b', 2)
+        self.travel(11)
+        self.assertEquals(None, cache.get('a'))
+        self.assertEquals(2, cache.get('b'))
+        self.assertTrue(cache.add('a', 3))
+
+    def test_eviction(self):
+        cache = LRUCache(max_size=100)
+        cache.set('a', 'x' * 30)
+        cache.set('b', 'x' * 30)
+        # a is now the most recently used
+        cache.get('a')
+        cache.set('c', 'x' * 30)
+        self.assertTrue(cache.size <= 100)
+        self.assertEquals(None, cache.get('b'))
+        self.assertTrue(cache.get('a'))
+        self.assertTrue(cache.get('c'))
+
+        # too big to ever fit
+        cache.set('d', 'x' * 200)
+        self.assertEquals(None, cache.get('d'))
+        self.assertTrue(cache.get('c'))
+
+
+class TestPageCache(CachingTestCase):
+
+    def walk(self, paginator):
+        page = paginator.page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.page(page.next_token)
+            pages.append(page)
+        return pages
+
+    def assertSamePages(self, expected, pages):
+        self.assertEquals([(list(p), p.previous_token, p.token, p.next_token)
+                           for p in expected],
+                          [(list(p), p.previous_token, p.token, p.next_token)
+                           for p in pages])
+
+    def test_paginator(self):
+        for backend in (None, LRUCache()):
+            get_cache('default').clear()
+            qs = SimpleModel.objects.all()
+            expected = self.walk(PerformantPaginator(qs, per_page=10))
+
+            cache = PageCache(backend=backend)
+            paginator = PerformantPaginator(qs, per_page=10, page_cache=cache)
+            with self.assertNumQueries(6):
+                self.assertSamePages(expected, self.walk(paginator))
+            # second time around it's all cached
+            with self.assertNumQueries(0):
+                self.assertSamePages(expected, self.walk(paginator))
+
+            # until something's saved
+            obj = expected[0][0]
+            obj.save()
+            with self.assertNumQueries(1):
+                self.assertEquals(obj, paginator.page()[0])
+            with self.assertNumQueries(0):
+                self.assertEquals(obj, paginator.page()[0])
+
+            # different page sizes and orderings don't collide
+            paginator = PerformantPaginator(qs, per_page=20, page_cache=cache)
+            self.assertEquals(3, len(self.walk(paginator)))
+            paginator = PerformantPaginator(qs, per_page=10, ordering='-pk',
+                                            page_cache=cache)
+            self.assertEquals(expected[-1][-1], paginator.page()[0])
+
+    def test_invalidation(self):
+        cache = PageCache()
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        page_cache=cache)
+        self.assertEquals(25, len(paginator.page(1)))
+        obj = SimpleModel.objects.order_by('pk')[0]
+        obj.name = 'renamed'
+        obj.save()
+        with self.assertNumQueries(1):
+            self.assertEquals('renamed', paginator.page()[0].name)
+        with self.assertNumQueries(0):
+            self.assertEquals('renamed', paginator.page()[0].name)
+
+    def test_fingerprint_once(self):
+        fingerprints = []
+
+        def fingerprint(queryset):
+            fingerprints.append(queryset)
+            return queryset_fingerprint(queryset)
+
+        pagination.queryset_fingerprint = fingerprint
+        try:
+            paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                            per_page=10,
+                                            page_cache=PageCache())
+            self.walk(paginator)
+            self.walk(paginator)
+        finally:
+            pagination.queryset_fingerprint = queryset_fingerprint
+        # the queryset was only compiled for the first key
+        self.assertEquals(1, len(fingerprints))
+
+    def test_empty(self):
+        paginator = PerformantPaginator(SimpleModel.objects.filter(pk__in=[]),
+                                        page_cache=PageCache())
+        for _ in range(2):
+            page = paginator.page()
+            self.assertEquals([], list(page))
+            self.assertFalse(page.has_next())
+
+    def test_timeout(self):
+        cache = PageCache(timeout=10, backend=LRUCache())
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        page_cache=cache)
+        paginator.page()
+        self.travel(11)
+        with self.assertNumQueries(1):
+            paginator.page()
+
+    def test_refetch(self):
+        # no invalidation so that we can see the refetching at work
+        cache = PageCache(refetch=True, invalidate=False)
+        qs = SimpleModel.objects.all()
+        paginator = PerformantPaginator(qs, per_page=10, page_cache=cache)
+        expected = self.walk(PerformantPaginator(qs, per_page=10))
+        self.walk(paginator)
+
+        # refetched with a single in_bulk query, seeing changes
+        qs.update(name='updated')
+        with self.assertNumQueries(1):
+            page = paginator.page(expected[1].token)
+        self.assertEquals(list(expected[1]), list(page))
+        self.assertEquals(['updated'] * 10, [o.name for o in page])
+        self.assertEquals(expected[1].next_token, page.next_token)
+
+        # if something's gone missing the page is fetched again
+        qs.filter(pk=expected[1][0].pk).delete()
+        with self.assertNumQueries(2):
+            page = paginator.page(expected[1].token)
+        self.assertEquals(list(expected[1])[1:] + list(expected[2])[:1],
+                          list(page))
+
+        # values aren't refetched
+        paginator = PerformantPaginator(qs.values('id', 'name'),
+                                        page_cache=cache)
+        first = list(paginator.page())
+        with self.assertNumQueries(0):
+            self.assertEquals(first, list(paginator.page()))
+
+
+# the real clock, to put back after travelling
+time = caching.time
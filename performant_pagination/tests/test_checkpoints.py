@@ -0,0 +1,180 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.paginator import EmptyPage, InvalidPage
+from django.test import TestCase
+from performant_pagination.caching import LRUCache
+from performant_pagination.checkpoints import Checkpoints
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import RelatedModel, SimpleModel
+
+
+class TestCheckpoints(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 7)) for i in range(53)]
+        )
+        self.checkpoints = Checkpoints(every=10, backend=LRUCache())
+
+    def walk(self, paginator):
+        tokens = []
+        token = None
+        while True:
+            page = paginator.page(token)
+            tokens.append(page.token)
+            token = page.next_token
+            if not token:
+                return tokens
+
+    def test_build(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5)
+        with self.assertNumQueries(6):
+            keys = self.checkpoints.build(paginator)
+        pks = list(SimpleModel.objects.order_by('pk')
+                   .values_list('pk', flat=True))
+        self.assertEquals([[pks[9]], [pks[19]], [pks[29]], [pks[39]],
+                           [pks[49]]], keys)
+        # stored, nothing more to do
+        with self.assertNumQueries(0):
+            self.assertEquals(keys, self.checkpoints.get(paginator))
+
+    def test_token_for_page(self):
+        for ordering in ('pk', ('-name',), ('name', '-pk')):
+            for per_page in (3, 5, 10, 25):
+                paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                                per_page=per_page,
+                                                ordering=ordering)
+                self.checkpoints.build(paginator)
+                for number, token in enumerate(self.walk(paginator), 1):
+                    self.assertEquals(token, self.checkpoints
+                                      .token_for_page(paginator, number))
+
+    def test_page(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5,
+                                        checkpoints=self.checkpoints)
+        objects = list(SimpleModel.objects.order_by('pk'))
+        self.checkpoints.build(paginator)
+        page = paginator.page(2)
+        self.assertEquals(objects[5:10], list(page))
+
+        # starts on a checkpoint, just the page's query
+        with self.assertNumQueries(1):
+            page = paginator.page(5)
+        self.assertEquals(objects[20:25], list(page))
+        # one to find the token, with a short skip from a checkpoint, one for
+        # the page
+        with self.assertNumQueries(2):
+            page = paginator.page(8)
+        self.assertEquals(objects[35:40], list(page))
+        page = paginator.page(11)
+        self.assertEquals(objects[50:], list(page))
+        self.assertFalse(page.has_next())
+
+        # still works as usual
+        self.assertEquals(objects[:5], list(paginator.page(1)))
+        self.assertEquals(objects[45:50],
+                          list(paginator.page(page.previous_token)))
+
+        with self.assertRaises(EmptyPage):
+            paginator.page(12)
+        with self.assertRaises(EmptyPage):
+            paginator.page(0)
+
+    def test_missing(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5,
+                                        checkpoints=self.checkpoints)
+        objects = list(SimpleModel.objects.order_by('pk'))
+        # within the first every rows there's no need for them
+        self.assertEquals(objects[5:10], list(paginator.page(2)))
+        # past that they're needed, and not built on the spot
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidPage):
+                paginator.page(5)
+        self.assertEquals(None, self.checkpoints.get(paginator))
+
+        # if any of them go missing they're not there
+        self.checkpoints.build(paginator)
+        self.assertEquals(objects[20:25], list(paginator.page(5)))
+        self.checkpoints.cache.clear()
+        with self.assertRaises(InvalidPage):
+            paginator.page(5)
+
+    def test_chunks(self):
+        checkpoints = Checkpoints(every=5, backend=LRUCache(), chunk_size=3)
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5,
+                                        checkpoints=checkpoints)
+        keys = checkpoints.build(paginator)
+        self.assertEquals(10, len(keys))
+        self.assertEquals(keys, checkpoints.get(paginator))
+        # 4 chunks and what points to them
+        self.assertEquals(5, len(checkpoints.cache._entries))
+        for number, token in enumerate(self.walk(paginator), 1):
+            self.assertEquals(token, checkpoints.token_for_page(paginator,
+                                                                number))
+        with self.assertRaises(ValueError):
+            Checkpoints(chunk_size=0)
+
+    def test_stale(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5,
+                                        checkpoints=self.checkpoints)
+        self.checkpoints.build(paginator)
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='more {0}'.format(i)) for i in range(50)]
+        )
+        # the checkpoints don't reach that far, rather than skipping the rest
+        # of the way it's empty until they're refreshed
+        with self.assertNumQueries(0):
+            with self.assertRaises(EmptyPage):
+                paginator.page(15)
+        self.checkpoints.refresh(paginator)
+        self.assertEquals(5, len(paginator.page(15)))
+
+    def test_token_for_page_invalid(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5)
+        with self.assertRaises(InvalidPage):
+            self.checkpoints.token_for_page(paginator, 'nope')
+        self.assertEquals(None, self.checkpoints.token_for_page(paginator,
+                                                                '1'))
+        with self.assertRaises(ValueError):
+            Checkpoints(every=0)
+
+    def test_refresh(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=5)
+        self.assertEquals(5, len(self.checkpoints.refresh(paginator)))
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='more {0}'.format(i)) for i in range(20)]
+        )
+        # only walks on from the final checkpoint
+        with self.assertNumQueries(3):
+            keys = self.checkpoints.refresh(paginator)
+        self.assertEquals(7, len(keys))
+        self.assertEquals(keys, self.checkpoints.build(paginator))
+        tokens = self.walk(paginator)
+        self.assertEquals(tokens[-1],
+                          self.checkpoints.token_for_page(paginator,
+                                                          len(tokens)))
+
+    def test_empty(self):
+        paginator = PerformantPaginator(SimpleModel.objects.filter(pk__in=[]),
+                                        per_page=5,
+                                        checkpoints=self.checkpoints)
+        self.assertEquals([], self.checkpoints.build(paginator))
+        self.assertEquals([], self.checkpoints.get(paginator))
+        self.assertEquals([], list(paginator.page(1)))
+
+    def test_related(self):
+        simple = SimpleModel.objects.all()
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(simple=simple[i % 5], number=i) for i in range(30)]
+        )
+        paginator = PerformantPaginator(RelatedModel.objects.all(),
+                                        per_page=4,
+                                        ordering=('simple__name', 'number'))
+        self.checkpoints.build(paginator)
+        for number, token in enumerate(self.walk(paginator), 1):
+            self.assertEquals(token, self.checkpoints.token_for_page(
+                paginator, number))
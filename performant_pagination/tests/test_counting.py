@@ -0,0 +1,87 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import TestCase
+from performant_pagination.counting import estimate_count
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import SimpleModel
+
+
+class TestEstimateCount(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i)) for i in range(53)]
+        )
+
+    def analyze(self):
+        cursor = connection.cursor()
+        cursor.execute('ANALYZE')
+        cursor.close()
+
+    def test_estimate_count(self):
+        # no statistics yet
+        self.assertEquals(None, estimate_count(SimpleModel.objects.all()))
+
+        self.analyze()
+        self.assertEquals(53, estimate_count(SimpleModel.objects.all()))
+        # the planner only knows about whole tables
+        self.assertEquals(None, estimate_count(
+            SimpleModel.objects.filter(name='object 1')))
+        self.assertEquals(None, estimate_count(SimpleModel.objects.all()[:5]))
+        # nor do grouped, annotated, or distinct querysets have a row for
+        # each of the table's
+        self.assertEquals(None, estimate_count(
+            SimpleModel.objects.values('name').annotate(n=Count('pk'))))
+        self.assertEquals(None, estimate_count(
+            SimpleModel.objects.annotate(n=Count('related_models'))))
+        self.assertEquals(None, estimate_count(
+            SimpleModel.objects.values('name').distinct()))
+
+    def test_transaction(self):
+        # the statistics aren't there, and the failure doesn't leave our
+        # transaction unusable
+        with transaction.atomic():
+            self.assertEquals(None, estimate_count(SimpleModel.objects.all()))
+            self.assertEquals(53, SimpleModel.objects.count())
+
+    def test_paginator(self):
+        self.analyze()
+        # the estimate is stale, it doesn't know about these
+        SimpleModel.objects.create(name='another')
+
+        # exact
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        allow_count=True)
+        self.assertEquals(None, paginator.count_is_exact)
+        self.assertEquals(54, paginator.count())
+        self.assertTrue(paginator.count_is_exact)
+
+        # below the threshold, exact
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        allow_count='estimate')
+        self.assertTrue(str(paginator))
+        self.assertEquals(54, paginator.count())
+        self.assertTrue(paginator.count_is_exact)
+
+        # above the threshold, estimated
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        allow_count='estimate',
+                                        count_threshold=50)
+        # the estimate's query, in a savepoint as we're in the test's
+        # transaction
+        with self.assertNumQueries(3):
+            self.assertEquals(53, paginator.count())
+        self.assertFalse(paginator.count_is_exact)
+
+        # no estimate, exact
+        paginator = PerformantPaginator(
+            SimpleModel.objects.exclude(name='another'),
+            allow_count='estimate', count_threshold=50)
+        self.assertEquals(53, paginator.count())
+        self.assertTrue(paginator.count_is_exact)
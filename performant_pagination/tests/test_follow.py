@@ -0,0 +1,147 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import connections
+from django.db.models.signals import post_save
+from django.test import TestCase
+from performant_pagination import follow
+from performant_pagination.follow import _wait
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import SimpleModel
+from threading import Timer
+from time import time
+
+
+class TestFollower(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i)) for i in range(23)]
+        )
+        self.paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                             per_page=10)
+
+    def tearDown(self):
+        follow.time = time
+        follow._wait = _wait
+
+    def fake_clock(self):
+        # waiting moves the clock on, rather than actually waiting, unless
+        # something's already woken the follower
+        now = [0]
+        waits = []
+
+        def wait(event, seconds):
+            if event.is_set():
+                return True
+            waits.append(seconds)
+            now[0] += seconds
+            return False
+
+        follow.time = lambda: now[0]
+        follow._wait = wait
+        return waits
+
+    def test_catch_up(self):
+        waits = self.fake_clock()
+        objects = list(SimpleModel.objects.order_by('pk'))
+        follower = self.paginator.follow(interval=1, timeout=1)
+        # a query for each list, and the one that comes up empty
+        with self.assertNumQueries(3):
+            it = iter(follower)
+            self.assertEquals(objects[:10], next(it))
+            self.assertEquals(objects[10:20], next(it))
+            self.assertEquals(objects[20:], next(it))
+        self.assertEquals([], list(it))
+        self.assertEquals([1], waits)
+        # picks up where it left off
+        self.assertEquals([], list(self.paginator.follow(follower.token,
+                                                         interval=1,
+                                                         timeout=1)))
+
+    def test_new_rows(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+        page = self.paginator.page()
+        it = iter(self.paginator.follow(page.next_token, interval=0.01,
+                                        timeout=0.05))
+        self.assertEquals(objects[10:20], next(it))
+        self.assertEquals(objects[20:], next(it))
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='new {0}'.format(i)) for i in range(3)]
+        )
+        self.assertEquals(['new 0', 'new 1', 'new 2'],
+                          [obj.name for obj in next(it)])
+        self.assertEquals([], list(it))
+
+    def test_inclusive(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+        token = self.paginator.token_for(objects[20].pk)
+        follower = self.paginator.follow(token, interval=0.01, timeout=0.01)
+        self.assertEquals([objects[20:]], list(follower))
+
+    def test_backoff(self):
+        waits = self.fake_clock()
+        follower = self.paginator.follow(interval=1, backoff=2,
+                                         max_interval=4, timeout=20)
+        it = iter(follower)
+        for _ in range(3):
+            next(it)
+        # waits of 1, 2, and then 4 until the timeout, with a look after each,
+        # rather than a look every 1
+        with self.assertNumQueries(7):
+            self.assertEquals([], list(it))
+        self.assertEquals([1, 2, 4, 4, 4, 4, 1], waits)
+
+    def test_receiver(self):
+        self.fake_clock()
+        receivers = len(post_save.receivers)
+        follower = self.paginator.follow(interval=1, timeout=1)
+        # nothing's connected until it's iterated
+        self.assertEquals(receivers, len(post_save.receivers))
+        it = iter(follower)
+        next(it)
+        self.assertEquals(receivers + 1, len(post_save.receivers))
+        # and it's let go of once it's done
+        list(it)
+        self.assertEquals(receivers, len(post_save.receivers))
+
+    def test_wake(self):
+        # see test_prefetch
+        connection = connections['default']
+        connection.allow_thread_sharing = True
+
+        def save():
+            connections['default'] = connection
+            SimpleModel.objects.create(name='woken')
+
+        follower = self.paginator.follow(interval=10, max_interval=10,
+                                         timeout=10)
+        it = iter(follower)
+        for _ in range(3):
+            next(it)
+        timer = Timer(0.05, save)
+        timer.start()
+        try:
+            start = time()
+            self.assertEquals(['woken'], [obj.name for obj in next(it)])
+            # well before the interval was up
+            self.assertTrue(time() - start < 5)
+        finally:
+            timer.join()
+            follower.close()
+            connection.allow_thread_sharing = False
+        self.assertEquals([], list(it))
+
+    def test_close(self):
+        follower = self.paginator.follow(interval=10)
+        it = iter(follower)
+        next(it)
+        follower.close()
+        self.assertEquals([], list(it))
+        with self.assertRaises(ValueError):
+            self.paginator.follow(interval=0)
+        with self.assertRaises(ValueError):
+            self.paginator.follow(interval=2, max_interval=1)
@@ -0,0 +1,185 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.db import connections
+from django.test import TestCase
+from performant_pagination.caching import LRUCache, PageCache
+from performant_pagination.instrumentation import Histogram, PageStats, \
+    page_served
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import SimpleModel
+import logging
+
+
+class _Handler(logging.Handler):
+
+    def __init__(self):
+        super(_Handler, self).__init__(logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestInstrumentation(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i)) for i in range(25)]
+        )
+        self.records = []
+        page_served.connect(self.receive)
+
+    def tearDown(self):
+        page_served.disconnect(self.receive)
+
+    def receive(self, sender, paginator, record, **kwargs):
+        self.records.append((paginator, record))
+
+    def test_records(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=10)
+        page = paginator.page()
+        page = paginator.page(page.next_token)
+
+        self.assertEquals(2, len(self.records))
+        first, second = [r for p, r in self.records]
+        self.assertTrue(all(p is paginator for p, _ in self.records))
+
+        self.assertEquals(None, first.token)
+        self.assertEquals(10, first.rows)
+        # nothing to decode on the first page
+        self.assertEquals(None, first.decode_time)
+        self.assertEquals(None, first.cache_hit)
+        self.assertEquals(None, first.prefetched)
+
+        self.assertEquals(page.token, second.token)
+        self.assertEquals(10, second.rows)
+        for record in (first, second):
+            self.assertTrue(record.query_time >= 0)
+            self.assertTrue(record.encode_time >= 0)
+            self.assertTrue(record.total_time >= record.query_time)
+        self.assertTrue(second.decode_time >= 0)
+
+    def test_cache_hits(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=10,
+                                        page_cache=PageCache(
+                                            backend=LRUCache()))
+        paginator.page()
+        paginator.page()
+
+        miss, hit = [r for _, r in self.records]
+        self.assertFalse(miss.cache_hit)
+        self.assertTrue(miss.query_time >= 0)
+        self.assertTrue(hit.cache_hit)
+        # it never got as far as the database
+        self.assertEquals(None, hit.query_time)
+        self.assertEquals(10, hit.rows)
+
+    def test_queries(self):
+        qs = SimpleModel.objects.all()
+        PerformantPaginator(qs, per_page=10).page()
+        PerformantPaginator(qs, per_page=10, late_lookup=True).page()
+        # the high-water mark and then the page
+        PerformantPaginator(qs, per_page=10, snapshot=True).page()
+        paginator = PerformantPaginator(qs, per_page=10,
+                                        page_cache=PageCache(
+                                            backend=LRUCache()))
+        paginator.page()
+        paginator.page()
+        self.assertEquals([1, 2, 2, 1, 0],
+                          [r.queries for _, r in self.records])
+
+        # counting doesn't log them or leave them lying around on the
+        # connection
+        connection = connections['default']
+        before = len(connection.queries)
+        handler = _Handler()
+        logger = logging.getLogger('django.db.backends')
+        level = logger.level
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        try:
+            PerformantPaginator(qs, per_page=10).page()
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEquals(before, len(connection.queries))
+        self.assertEquals([], handler.records)
+        self.assertFalse('cursor' in connection.__dict__)
+        # or get in the way of anyone else counting them
+        with self.assertNumQueries(2):
+            PerformantPaginator(qs, per_page=10, late_lookup=True).page()
+        self.assertEquals(2, self.records[-1][1].queries)
+
+    def test_no_listeners(self):
+        page_served.disconnect(self.receive)
+        paginator = PerformantPaginator(SimpleModel.objects.all(), per_page=10)
+        paginator.page()
+        self.assertEquals([], self.records)
+
+
+class TestPageStats(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i)) for i in range(25)]
+        )
+        self.stats = PageStats(slowest=2)
+        self.stats.connect()
+
+    def tearDown(self):
+        self.stats.disconnect()
+
+    def test_histogram(self):
+        histogram = Histogram((1, 10))
+        for value in (0.5, 1, 5, 10, 11, 100):
+            histogram.add(value)
+        self.assertEquals([2, 2, 2], histogram.counts)
+        self.assertEquals(6, histogram.total)
+        self.assertEquals(127.5, histogram.sum)
+
+    def test_snapshot(self):
+        by_pk = PerformantPaginator(SimpleModel.objects.all(), per_page=10)
+        by_name = PerformantPaginator(SimpleModel.objects.all(), per_page=10,
+                                      ordering=('name',))
+        token = None
+        while True:
+            page = by_pk.page(token)
+            token = page.next_token
+            if not token:
+                break
+        by_name.page()
+
+        snapshot = self.stats.snapshot()
+        everything = snapshot['all']
+        self.assertEquals(4, everything['pages'])
+        self.assertEquals(35, everything['rows'])
+        self.assertEquals(4, everything['queries'])
+        self.assertEquals(0, everything['cache_hits'])
+        self.assertEquals(4, everything['total_time']['total'])
+        self.assertEquals(4, everything['query_time']['total'])
+        # only the pages after the first had tokens to decode
+        self.assertEquals(2, everything['decode_time']['total'])
+
+        orderings = snapshot['orderings']
+        self.assertEquals(set(('tests.SimpleModel:pk',
+                               'tests.SimpleModel:name,pk')),
+                          set(orderings.keys()))
+        self.assertEquals(3, orderings['tests.SimpleModel:pk']['pages'])
+        self.assertEquals(25, orderings['tests.SimpleModel:pk']['rows'])
+        self.assertEquals(1, orderings['tests.SimpleModel:name,pk']['pages'])
+
+        slowest = snapshot['slowest']
+        self.assertEquals(2, len(slowest))
+        self.assertTrue(slowest[0][0] >= slowest[1][0])
+
+        self.stats.reset()
+        self.assertEquals(0, self.stats.snapshot()['all']['pages'])
+
+    def test_disconnect(self):
+        self.stats.disconnect()
+        PerformantPaginator(SimpleModel.objects.all()).page()
+        self.assertEquals(0, self.stats.snapshot()['all']['pages'])
@@ -0,0 +1,176 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.test import TestCase
+from multiprocessing.pool import ThreadPool
+from performant_pagination import merge
+from performant_pagination.merge import MergePaginator
+from performant_pagination.tests.models import SimpleModel
+from performant_pagination.prefetch import _close_connections
+from performant_pagination.tokens import BinaryTokenCodec, Token
+from threading import Lock, current_thread
+
+
+class TestMergePaginator(TestCase):
+
+    def setUp(self):
+        # lumpy, so that the shards take turns unevenly
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0:02d}'.format(i % 23))
+             for i in range(61)]
+        )
+        # stand-ins for shards, each with their own part of the table
+        self.shards = [SimpleModel.objects.filter(pk__in=pks) for pks in
+                       self.split(SimpleModel.objects.values_list('pk',
+                                                                  flat=True))]
+
+    def split(self, pks):
+        shards = [[], [], []]
+        for pk in pks:
+            shards[0 if pk < 10 else pk % 2 + 1].append(pk)
+        return shards
+
+    def walk(self, paginator):
+        page = paginator.page()
+        walked = list(page)
+        pages = 1
+        while page.has_next():
+            self.assertFalse(page.has_previous())
+            page = paginator.page(page.next_page_number())
+            walked.extend(page)
+            pages += 1
+        return pages, walked
+
+    def test_walk(self):
+        for ordering, expected in (
+            ('pk', ('pk',)),
+            ('-pk', ('-pk',)),
+            (('name',), ('name', 'pk')),
+            (('-name', 'pk'), ('-name', 'pk')),
+        ):
+            objects = list(SimpleModel.objects.order_by(*expected))
+            for per_page in (1, 7, 20, 61, 100):
+                paginator = MergePaginator(self.shards, per_page=per_page,
+                                           ordering=ordering, workers=1)
+                # one query for each shard, for each page
+                with self.assertNumQueries(3):
+                    paginator.page()
+                pages, walked = self.walk(paginator)
+                self.assertEquals(objects, walked)
+                self.assertEquals(max((61 + per_page - 1) // per_page, 1),
+                                  pages)
+
+    def test_exhausted_shards(self):
+        paginator = MergePaginator(self.shards, per_page=10, workers=1)
+        page = paginator.page()
+        # the first shard has all of the first 9 objects and nothing more,
+        # it's done
+        with self.assertNumQueries(2):
+            page = paginator.page(page.next_token)
+        self.assertEquals(list(SimpleModel.objects.order_by('pk')[10:20]),
+                          list(page))
+
+    def test_empty(self):
+        paginator = MergePaginator([SimpleModel.objects.none(),
+                                    SimpleModel.objects.filter(pk=-1)],
+                                   workers=1)
+        page = paginator.page()
+        self.assertEquals([], list(page))
+        self.assertFalse(page.has_next())
+
+    def test_codec(self):
+        objects = list(SimpleModel.objects.order_by('-name', '-pk'))
+        paginator = MergePaginator(self.shards, per_page=10,
+                                   ordering=('-name',), workers=1,
+                                   codec=BinaryTokenCodec(secret='s3cr3t'))
+        self.assertEquals(objects, self.walk(paginator)[1])
+
+    def test_invalid(self):
+        paginator = MergePaginator(self.shards, workers=1)
+        page = paginator.page()
+        self.assertTrue(page.next_token)
+        for token in ('garbage', paginator.codec.encode(Token([1, 2, 3, 4]))):
+            with self.assertRaises(InvalidPage):
+                paginator.page(token)
+        with self.assertRaises(ValueError):
+            MergePaginator([])
+
+    def test_threaded(self):
+        # see test_prefetch
+        connection = connections['default']
+        connection.allow_thread_sharing = True
+
+        def share():
+            connections['default'] = connection
+
+        pool = ThreadPool(3, initializer=share)
+        try:
+            objects = list(SimpleModel.objects.order_by('name', 'pk'))
+            paginator = MergePaginator(self.shards, per_page=10,
+                                       ordering=('name',), pool=pool)
+            # the threads share one sqlite connection, which can't run more
+            # than one query at a time
+            lock = Lock()
+            fetch = paginator._fetch
+
+            def locked(args):
+                with lock:
+                    return fetch(args)
+
+            paginator._fetch = locked
+            self.assertEquals(objects, self.walk(paginator)[1])
+            paginator.close()
+        finally:
+            pool.close()
+            pool.join()
+            connection.allow_thread_sharing = False
+
+    def test_connections(self):
+        fetched = []
+        closed = []
+
+        def fetch(args):
+            fetched.append(current_thread())
+            return []
+
+        def close_connections():
+            closed.append(current_thread())
+
+        paginator = MergePaginator(self.shards, workers=3)
+        paginator._fetch = fetch
+        merge._close_connections = close_connections
+        try:
+            paginator.page()
+            paginator.page()
+            # the threads hang on to their connections from page to page
+            self.assertEquals(6, len(fetched))
+            self.assertEquals([], closed)
+        finally:
+            paginator.close()
+            merge._close_connections = _close_connections
+        # until they're closed, by every one of the threads
+        self.assertEquals(3, len(set(closed)))
+        self.assertTrue(set(fetched) <= set(closed))
+
+    def test_with(self):
+        closed = []
+
+        def close_connections():
+            closed.append(current_thread())
+
+        merge._close_connections = close_connections
+        try:
+            with MergePaginator(self.shards, workers=3) as paginator:
+                paginator._fetch = lambda args: []
+                paginator.page()
+                self.assertEquals([], closed)
+        finally:
+            merge._close_connections = _close_connections
+        # leaving the block closed the threads, and their connections
+        self.assertEquals(3, len(set(closed)))
+        self.assertEquals(None, paginator._pool)
@@ -6,11 +6,17 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 from base64 import b64encode
 from datetime import datetime, timedelta
-from django.core.paginator import Page
+from django.core.paginator import InvalidPage, Page
+from django.db import connections
+from django.db.models import Count
 from django.test import TestCase
+from multiprocessing.pool import ThreadPool
+from performant_pagination import pagination
 from performant_pagination.pagination import PerformantPaginator
 from performant_pagination.tests.models import RelatedModel, SimpleModel, \
     TimedModel
+from performant_pagination.tokens import Token
+from threading import Lock, current_thread
 
 
 class TestBasicPagination(TestCase):
@@ -118,11 +124,12 @@ class TestBasicPagination(TestCase):
         # and the expected next tokens
         self.assertEquals(b64encode(str(objects[24].pk)), page.token)
         self.assertEquals(None, page.next_token)
-        self.assertEquals('', page.previous_token)
+        previous_token = '~' + b64encode(str(objects[25].pk))
+        self.assertEquals(previous_token, page.previous_token)
 
         # check the page's methods
         self.assertTrue(page.has_previous())
-        self.assertEquals('', page.previous_page_number())
+        self.assertEquals(previous_token, page.previous_page_number())
         self.assertFalse(page.has_next())
         self.assertEquals(None, page.next_page_number())
 
@@ -164,11 +171,12 @@ class TestBasicPagination(TestCase):
         # and the expected next tokens
         self.assertEquals(b64encode(str(objects[24].pk)), page.token)
         self.assertEquals(None, page.next_token)
-        self.assertEquals('', page.previous_token)
+        previous_token = '~' + b64encode(str(objects[25].pk))
+        self.assertEquals(previous_token, page.previous_token)
 
         # check the page's methods
         self.assertTrue(page.has_previous())
-        self.assertEquals('', page.previous_page_number())
+        self.assertEquals(previous_token, page.previous_page_number())
         self.assertFalse(page.has_next())
         self.assertEquals(None, page.next_page_number())
 
@@ -209,14 +217,68 @@ class TestBasicPagination(TestCase):
         # and the expected next tokens
         self.assertEquals(b64encode(objects[24].name), page.token)
         self.assertEquals(None, page.next_token)
-        self.assertEquals('', page.previous_token)
+        previous_token = '~' + b64encode(objects[25].name)
+        self.assertEquals(previous_token, page.previous_token)
 
         # check the page's methods
         self.assertTrue(page.has_previous())
-        self.assertEquals('', page.previous_page_number())
+        self.assertEquals(previous_token, page.previous_page_number())
         self.assertFalse(page.has_next())
         self.assertEquals(None, page.next_page_number())
 
+    def test_single_query(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=11)
+        token = b64encode(str(objects[21].pk))
+
+        # a page, including its previous token, is a single query
+        with self.assertNumQueries(1):
+            page = paginator.page(token)
+            self.assertTrue(page.has_previous())
+            self.assertEquals('~' + b64encode(str(objects[22].pk)),
+                              page.previous_token)
+        self.assertEquals(objects[22:], list(page))
+
+        # and so is going backwards
+        with self.assertNumQueries(1):
+            page = paginator.page(page.previous_token)
+            self.assertTrue(page.has_previous())
+            self.assertTrue(page.has_next())
+        self.assertEquals(objects[11:22], list(page))
+        self.assertEquals('~' + b64encode(str(objects[11].pk)),
+                          page.previous_token)
+        self.assertEquals(b64encode(str(objects[21].pk)), page.next_token)
+
+        # back to the first page, which has no previous
+        page = paginator.page(page.previous_token)
+        self.assertEquals(objects[:11], list(page))
+        self.assertFalse(page.has_previous())
+        self.assertEquals(b64encode(str(objects[10].pk)), page.next_token)
+
+    def test_off_the_end(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10)
+        token = b64encode(str(objects[-1].pk))
+        page = paginator.page(token)
+        self.assertEquals([], list(page))
+        self.assertFalse(page.has_next())
+        # we can still walk back from the token itself
+        self.assertEquals('~' + token, page.previous_token)
+        page = paginator.page(page.previous_token)
+        self.assertEquals(objects[-11:-1], list(page))
+
+        # and there's nothing before the start
+        page = paginator.page('~' + b64encode(str(objects[0].pk)))
+        self.assertEquals([], list(page))
+        self.assertFalse(page.has_previous())
+        # but next will get us to the first page
+        self.assertEquals('', page.next_token)
+        self.assertTrue(page.has_next())
+
     def test_page_sizes(self):
         objects = SimpleModel.objects.order_by('pk')
 
@@ -255,11 +317,12 @@ class TestBasicPagination(TestCase):
         # and the expected next tokens
         self.assertEquals(b64encode(str(objects[10].pk)), page.token)
         self.assertEquals(b64encode(str(objects[21].pk)), page.next_token)
-        self.assertEquals('', page.previous_token)
+        previous_token = '~' + b64encode(str(objects[11].pk))
+        self.assertEquals(previous_token, page.previous_token)
 
         # check the page's methods
         self.assertTrue(page.has_previous())
-        self.assertEquals('', page.previous_page_number())
+        self.assertEquals(previous_token, page.previous_page_number())
         self.assertTrue(page.has_next())
         self.assertEquals(b64encode(str(objects[21].pk)),
                           page.next_page_number())
@@ -273,12 +336,12 @@ class TestBasicPagination(TestCase):
         # and the expected next tokens
         self.assertEquals(b64encode(str(objects[21].pk)), page.token)
         self.assertEquals(None, page.next_token)
-        self.assertEquals(b64encode(str(objects[10].pk)), page.previous_token)
+        previous_token = '~' + b64encode(str(objects[22].pk))
+        self.assertEquals(previous_token, page.previous_token)
 
         # check the page's methods
         self.assertTrue(page.has_previous())
-        self.assertEquals(b64encode(str(objects[10].pk)),
-                          page.previous_page_number())
+        self.assertEquals(previous_token, page.previous_page_number())
         self.assertFalse(page.has_next())
         self.assertEquals(None, page.next_page_number())
 
@@ -359,7 +422,8 @@ class TestRelationships(TestCase):
         # make sure we got the expected data
         self.assertEquals(list(objects[25:50]), list(page))
         # and the expected next tokens
-        self.assertEquals('', page.previous_token)
+        self.assertEquals('~' + b64encode(objects[25].simple.name),
+                          page.previous_token)
         self.assertEquals(b64encode(objects[24].simple.name), page.token)
         self.assertEquals(b64encode(objects[49].simple.name), page.next_token)
 
@@ -383,6 +447,27 @@ class TestRelationships(TestCase):
         self.assertEquals(b64encode(objects[24].simple.name), page.next_token)
         self.assertEquals(None, page.previous_token)
 
+    def test_related_queries(self):
+        objects = list(RelatedModel.objects.order_by('-simple__name', 'pk'))
+
+        paginator = PerformantPaginator(RelatedModel.objects.all(),
+                                        per_page=20,
+                                        ordering=('-simple__name', 'pk'))
+        # the relationship comes along with the objects, so building tokens
+        # doesn't lazily load it
+        with self.assertNumQueries(1):
+            page = paginator.page()
+            self.assertTrue(page.next_token)
+        with self.assertNumQueries(1):
+            page = paginator.page(page.next_token)
+            self.assertTrue(page.previous_token)
+            self.assertTrue(page.next_token)
+        self.assertEquals(objects[20:40], list(page))
+
+        # and the same goes for iteration
+        with self.assertNumQueries(7):
+            self.assertEquals(objects, list(paginator.iter_objects()))
+
 
 class TestDateTime(TestCase):
     maxDiff = None
@@ -429,9 +514,739 @@ class TestDateTime(TestCase):
         # second page
         page = paginator.page(page.next_token)
         self.assertTrue(Page)
-        self.assertEquals('', page.previous_token)
+        self.assertEquals('~' + tokenize_datetime(
+            timed_models[25].when_datetime), page.previous_token)
         self.assertEquals(tokenize_datetime(timed_models[24].when_datetime),
                           page.token)
         self.assertEquals(tokenize_datetime(timed_models[49].when_datetime),
                           page.next_token)
         self.assertEquals(timed_models[25:50], list(page))
+
+
+class TestComposite(TestCase):
+
+    def setUp(self):
+        # lots of duplicate names so that name alone isn't unique
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 4)) for i in range(53)]
+        )
+
+    def walk(self, paginator):
+        page = paginator.page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.page(page.next_page_number())
+            pages.append(page)
+        return pages
+
+    def test_tie_breaker(self):
+        objects = list(SimpleModel.objects.order_by('name', 'pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, ordering=('name',))
+        self.assertEquals(('name', 'pk'), paginator._orderings)
+
+        pages = self.walk(paginator)
+        self.assertEquals(6, len(pages))
+        self.assertEquals(objects, [o for page in pages for o in page])
+
+        # every component of the key is in the token
+        last = objects[9]
+        self.assertEquals('{0}.{1}'.format(b64encode(last.name),
+                                           b64encode(str(last.pk))),
+                          pages[0].next_token)
+
+        # and we can walk backwards
+        page = paginator.page(pages[-1].previous_page_number())
+        self.assertEquals(objects[40:50], list(page))
+
+    def test_reversed_tie_breaker(self):
+        objects = list(SimpleModel.objects.order_by('-name', '-pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, ordering=['-name'])
+        self.assertEquals(('-name', '-pk'), paginator._orderings)
+
+        pages = self.walk(paginator)
+        self.assertEquals(objects, [o for page in pages for o in page])
+
+    def test_mixed_directions(self):
+        objects = list(SimpleModel.objects.order_by('-name', 'id'))
+
+        # explicit pk, by name, so nothing is added
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=7, ordering=('-name', 'id'))
+        self.assertEquals(('-name', 'id'), paginator._orderings)
+
+        pages = self.walk(paginator)
+        self.assertEquals(8, len(pages))
+        self.assertEquals(objects, [o for page in pages for o in page])
+
+    def test_invalid_token(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        ordering=('name',))
+        with self.assertRaises(InvalidPage):
+            paginator.page('.'.join([b64encode('object 1'), b64encode('1'),
+                                     b64encode('2')]))
+        # just the name is a seek to the names after it
+        objects = list(SimpleModel.objects.order_by('name', 'pk'))
+        self.assertEquals(objects[27:52],
+                          list(paginator.page(b64encode('object 1'))))
+
+
+class TestIteration(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 7)) for i in range(53)]
+        )
+
+    def test_iter_batches(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10)
+        # one query per batch, the short final one tells us we're done
+        with self.assertNumQueries(6):
+            batches = list(paginator.iter_batches())
+        self.assertEquals([10, 10, 10, 10, 10, 3],
+                          [len(batch) for batch in batches])
+        self.assertEquals(objects, [o for batch in batches for o in batch])
+
+        # explicit batch_size, that happens to divide things evenly, needs one
+        # more to see that there's nothing left
+        with self.assertNumQueries(2):
+            batches = list(paginator.iter_batches(batch_size=53))
+        self.assertEquals([53], [len(batch) for batch in batches])
+
+    def test_iter_objects(self):
+        objects = list(SimpleModel.objects.order_by('-name', 'pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        ordering=('-name', 'pk'))
+        self.assertEquals(objects, list(paginator.iter_objects(batch_size=4)))
+
+        # empty
+        paginator = PerformantPaginator(SimpleModel.objects.none())
+        self.assertEquals([], list(paginator.iter_objects()))
+
+    def test_related(self):
+        relateds = []
+        for simple in SimpleModel.objects.all():
+            relateds.append(RelatedModel(number=simple.pk, simple=simple))
+        RelatedModel.objects.bulk_create(relateds)
+        objects = list(RelatedModel.objects.order_by('simple__name', 'pk'))
+
+        paginator = PerformantPaginator(RelatedModel.objects.all(),
+                                        ordering=('simple__name',))
+        self.assertEquals(objects, list(paginator.iter_objects(batch_size=5)))
+
+
+class TestPartitions(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 7)) for i in range(53)]
+        )
+
+    def assertPartitions(self, expected, paginators):
+        self.assertEquals(expected, [o for paginator in paginators
+                                     for o in paginator.iter_objects()])
+
+    def test_numeric(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10)
+        paginators = paginator.partitions(4)
+        self.assertEquals(4, len(paginators))
+        for p in paginators:
+            self.assertEquals(10, p.per_page)
+            self.assertTrue(p.queryset.count() > 10)
+        self.assertPartitions(objects, paginators)
+
+        # reversed partitions come back in reverse
+        objects.reverse()
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        ordering='-pk')
+        self.assertPartitions(objects, paginator.partitions(3))
+
+        # asking for more partitions than there are values
+        paginator = PerformantPaginator(SimpleModel.objects.filter(
+            pk__in=[o.pk for o in objects[:2]]))
+        paginators = paginator.partitions(4)
+        self.assertEquals(2, len(paginators))
+
+        # nothing to partition
+        paginator = PerformantPaginator(SimpleModel.objects.none())
+        self.assertEquals([], paginator.partitions(4))
+
+    def test_sampled(self):
+        objects = list(SimpleModel.objects.order_by('name', 'pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        ordering=('name',))
+        paginators = paginator.partitions(3)
+        self.assertEquals(3, len(paginators))
+        self.assertPartitions(objects, paginators)
+
+    def test_datetime(self):
+        # clear of TestDateTime's objects, which stick around
+        base = datetime(2003, 10, 27, 8, 44, 30)
+        TimedModel.objects.bulk_create(
+            [TimedModel(when_datetime=base - timedelta(days=i, minutes=i),
+                        when_date=base - timedelta(days=i),
+                        when_time=base - timedelta(minutes=i))
+             for i in range(30)]
+        )
+        qs = TimedModel.objects.filter(when_date__lte=base)
+        for ordering in ('when_datetime', '-when_date'):
+            objects = list(qs.order_by(ordering))
+            paginator = PerformantPaginator(qs, ordering=ordering)
+            paginators = paginator.partitions(5)
+            self.assertEquals(5, len(paginators))
+            self.assertPartitions(objects, paginators)
+
+    def test_map(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+
+        paginator = PerformantPaginator(SimpleModel.objects.all())
+        results = paginator.map(lambda batch: [o.pk for o in batch],
+                                workers=1, partitions=3, batch_size=7)
+        self.assertTrue(all(len(result) <= 7 for result in results))
+        self.assertEquals([o.pk for o in objects],
+                          [pk for result in results for pk in result])
+
+    def test_map_threaded(self):
+        # see test_prefetch, map's pool has to share our sqlite connection
+        connection = connections['default']
+        connection.allow_thread_sharing = True
+
+        def share():
+            connections['default'] = connection
+
+        def shared_pool(workers):
+            return ThreadPool(workers, initializer=share)
+
+        # which one can't run more than one query at a time
+        lock = Lock()
+        paginator = PerformantPaginator(SimpleModel.objects.all())
+        partitions = paginator.partitions
+
+        def locked_partitions(n):
+            paginators = partitions(n)
+            for p in paginators:
+                p.iter_batches = locked(p.iter_batches)
+            return paginators
+
+        def locked(iter_batches):
+            def wrapped(batch_size=None):
+                batches = iter_batches(batch_size)
+                while True:
+                    with lock:
+                        batch = next(batches, None)
+                    if batch is None:
+                        return
+                    yield batch
+            return wrapped
+
+        threads = set()
+
+        def func(batch):
+            threads.add(current_thread())
+            return [o.pk for o in batch]
+
+        paginator.partitions = locked_partitions
+        pagination.ThreadPool = shared_pool
+        try:
+            objects = list(SimpleModel.objects.order_by('pk'))
+            results = paginator.map(func, workers=3, batch_size=7)
+            self.assertTrue(all(len(result) <= 7 for result in results))
+            self.assertEquals([o.pk for o in objects],
+                              [pk for result in results for pk in result])
+            # all of the work happened in the pool's threads
+            self.assertFalse(current_thread() in threads)
+        finally:
+            pagination.ThreadPool = ThreadPool
+            connection.allow_thread_sharing = False
+
+
+class TestProjection(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 7)) for i in range(53)]
+        )
+
+    def assertSameWalk(self, expected, paginator, ordering):
+        # walks the paginator's rows, checking them against expected and
+        # their tokens against those of an objects based paginator
+        objects = PerformantPaginator(paginator.queryset.model.objects.all(),
+                                      per_page=paginator.per_page,
+                                      ordering=ordering)
+        page = paginator.page()
+        object_page = objects.page()
+        rows = list(page)
+        while page.has_next():
+            self.assertEquals(object_page.next_token, page.next_token)
+            page = paginator.page(page.next_token)
+            object_page = objects.page(object_page.next_token)
+            self.assertEquals(object_page.previous_token, page.previous_token)
+            rows.extend(page)
+        self.assertEquals(expected, rows)
+
+    def test_values(self):
+        qs = SimpleModel.objects.values('id', 'name')
+        expected = list(qs.order_by('name', 'pk'))
+        self.assertIsInstance(expected[0], dict)
+        paginator = PerformantPaginator(qs, per_page=10,
+                                        ordering=('name', 'pk'))
+        self.assertSameWalk(expected, paginator, ('name', 'pk'))
+
+        # all fields
+        qs = SimpleModel.objects.values()
+        expected = list(qs.order_by('-pk'))
+        paginator = PerformantPaginator(qs, per_page=10, ordering='-pk')
+        self.assertSameWalk(expected, paginator, '-pk')
+
+    def test_values_list(self):
+        qs = SimpleModel.objects.values_list('name', 'pk')
+        expected = list(qs.order_by('-name', '-pk'))
+        self.assertIsInstance(expected[0], tuple)
+        paginator = PerformantPaginator(qs, per_page=9, ordering=('-name',))
+        self.assertSameWalk(expected, paginator, ('-name',))
+
+        # flat
+        qs = SimpleModel.objects.values_list('id', flat=True)
+        expected = list(qs.order_by('pk'))
+        paginator = PerformantPaginator(qs, per_page=10)
+        self.assertSameWalk(expected, paginator, 'pk')
+
+    def test_related(self):
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(number=simple.pk, simple=simple)
+             for simple in SimpleModel.objects.all()]
+        )
+        qs = RelatedModel.objects.values('pk', 'number', 'simple__name')
+        expected = list(qs.order_by('simple__name', 'pk'))
+        paginator = PerformantPaginator(qs, per_page=10,
+                                        ordering=('simple__name', 'pk'))
+        self.assertSameWalk(expected, paginator, ('simple__name', 'pk'))
+
+        # and by the foreign key itself
+        qs = RelatedModel.objects.values_list('number', 'simple')
+        expected = list(qs.order_by('simple'))
+        paginator = PerformantPaginator(qs, per_page=10, ordering='simple')
+        self.assertSameWalk(expected, paginator, 'simple')
+
+    def test_datetime(self):
+        base = datetime(2005, 10, 27, 8, 44, 15)
+        TimedModel.objects.bulk_create(
+            [TimedModel(when_datetime=base - timedelta(days=i, minutes=i),
+                        when_date=base - timedelta(days=i),
+                        when_time=base - timedelta(minutes=i))
+             for i in range(30)]
+        )
+        qs = TimedModel.objects.filter(when_date__lte=base)
+        paginator = PerformantPaginator(
+            qs.values('when_datetime', 'when_time'), per_page=7,
+            ordering='when_time')
+        page = paginator.page()
+        objects = PerformantPaginator(qs, per_page=7, ordering='when_time')
+        self.assertEquals(objects.page().next_token, page.next_token)
+        self.assertEquals(list(qs.order_by('when_time')[7:14]
+                               .values('when_datetime', 'when_time')),
+                          list(paginator.page(page.next_token)))
+
+    def test_missing_ordering(self):
+        with self.assertRaises(ValueError):
+            PerformantPaginator(SimpleModel.objects.values('name'))
+        with self.assertRaises(ValueError):
+            PerformantPaginator(SimpleModel.objects.values_list('pk'),
+                                ordering=('name',))
+
+    def test_iteration(self):
+        qs = SimpleModel.objects.values_list('name', 'id')
+        paginator = PerformantPaginator(qs, ordering=('name',))
+        self.assertEquals(list(qs.order_by('name', 'pk')),
+                          list(paginator.iter_objects(batch_size=6)))
+
+
+class TestSeek(TestCase):
+
+    def setUp(self):
+        base = datetime(2005, 3, 1, 12, 0, 15)
+        TimedModel.objects.bulk_create(
+            [TimedModel(when_datetime=base - timedelta(hours=i * 7),
+                        when_date=base - timedelta(days=i),
+                        when_time=(base - timedelta(seconds=i * 3)).time())
+             for i in range(40)]
+        )
+        simple = [SimpleModel.objects.create(name='object {0}'.format(i % 4))
+                  for i in range(8)]
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(simple=simple[i % 8], number=i) for i in range(24)]
+        )
+
+    def test_page_at(self):
+        qs = TimedModel.objects.filter(when_datetime__year=2005)
+        objects = list(qs.order_by('-when_datetime'))
+        paginator = PerformantPaginator(qs, per_page=10,
+                                        ordering='-when_datetime')
+        at = objects[13].when_datetime
+
+        with self.assertNumQueries(1):
+            page = paginator.page_at(at)
+        self.assertEquals(objects[13:23], list(page))
+        self.assertEquals(objects[3:13],
+                          list(paginator.page(page.previous_token)))
+        self.assertEquals(objects[23:33],
+                          list(paginator.page(page.next_token)))
+
+        page = paginator.page_at(at, inclusive=False)
+        self.assertEquals(objects[14:24], list(page))
+
+        # strings, between the objects, will do
+        page = paginator.page_at(
+            (at - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEquals(objects[14:24], list(page))
+
+        # the token's just a token
+        self.assertEquals(page.token,
+                          paginator.token_for(at - timedelta(hours=1)))
+
+        # before everything, after everything
+        self.assertEquals(objects[:10],
+                          list(paginator.page_at(datetime(2006, 1, 1))))
+        page = paginator.page_at(datetime(2004, 1, 1))
+        self.assertEquals([], list(page))
+        self.assertEquals(objects[-10:],
+                          list(paginator.page(page.previous_token)))
+
+    def test_composite(self):
+        objects = list(RelatedModel.objects.order_by('-simple__name',
+                                                     'number'))
+        paginator = PerformantPaginator(RelatedModel.objects.all(),
+                                        per_page=5,
+                                        ordering=('-simple__name', 'number'))
+        # partial, just the leading field
+        page = paginator.page_at('object 2')
+        self.assertEquals(objects[6:11], list(page))
+        self.assertEquals(objects[11:16],
+                          list(paginator.page(page.next_token)))
+        self.assertEquals(objects[1:6],
+                          list(paginator.page(page.previous_token)))
+        page = paginator.page_at({'simple__name': 'object 2'},
+                                 inclusive=False)
+        self.assertEquals(objects[12:17], list(page))
+
+        # both
+        page = paginator.page_at(('object 2', 10))
+        self.assertEquals(objects[8:13], list(page))
+        page = paginator.page_at({'number': 10, 'simple__name': 'object 2'},
+                                 inclusive=False)
+        self.assertEquals(objects[9:14], list(page))
+        # all three, pk by its name
+        obj = objects[8]
+        page = paginator.page_at({'simple__name': 'object 2', 'number': 10,
+                                  'id': obj.pk})
+        self.assertEquals(objects[8:13], list(page))
+
+    def test_invalid(self):
+        paginator = PerformantPaginator(TimedModel.objects.all(),
+                                        ordering=('-when_datetime',))
+        with self.assertRaises(InvalidPage):
+            paginator.token_for('not a date')
+        with self.assertRaises(ValueError):
+            paginator.token_for([])
+        with self.assertRaises(ValueError):
+            paginator.token_for([datetime(2005, 1, 1), 1, 2])
+        # not a prefix
+        with self.assertRaises(ValueError):
+            paginator.token_for({'pk': 1})
+        with self.assertRaises(ValueError):
+            paginator.token_for({'when_date': 1})
+
+
+class TestLateLookup(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 5)) for i in range(33)]
+        )
+
+    def test_walk(self):
+        for ordering, expected in (('pk', ('pk',)),
+                                   (('-name',), ('-name', '-pk'))):
+            objects = list(SimpleModel.objects.order_by(*expected))
+            paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                            per_page=10, ordering=ordering,
+                                            late_lookup=True)
+            # the keys and then the objects
+            with self.assertNumQueries(2):
+                page = paginator.page()
+            walked = list(page)
+            while page.has_next():
+                page = paginator.page(page.next_token)
+                walked.extend(page)
+            self.assertEquals(objects, walked)
+            self.assertEquals(objects[20:30],
+                              list(paginator.page(page.previous_token)))
+
+    def test_related(self):
+        simple = list(SimpleModel.objects.all()[:3])
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(simple=simple[i % 3], number=i) for i in range(12)]
+        )
+        objects = list(RelatedModel.objects.order_by('simple__name', 'pk'))
+        paginator = PerformantPaginator(RelatedModel.objects.all(),
+                                        per_page=5, late_lookup=True,
+                                        ordering=('simple__name',))
+        page = paginator.page()
+        self.assertEquals(objects[:5], list(page))
+        # the relationship came along with them
+        with self.assertNumQueries(0):
+            [obj.simple.name for obj in page]
+
+    def test_deleted(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, late_lookup=True)
+        # as if they were all deleted after we found them
+        paginator.queryset.in_bulk = lambda pks: {}
+        page = paginator.page()
+        self.assertEquals(objects[:10], list(page))
+        self.assertTrue(page.has_next())
+
+    def test_values(self):
+        with self.assertRaises(ValueError):
+            PerformantPaginator(SimpleModel.objects.values('pk', 'name'),
+                                late_lookup=True)
+
+
+class TestCompiled(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 6)) for i in range(47)]
+        )
+
+    def walk(self, paginator):
+        page = paginator.page()
+        walked = list(page)
+        while page.has_next():
+            page = paginator.page(page.next_token)
+            walked.extend(page)
+        # and back again
+        backward = []
+        while page.has_previous():
+            page = paginator.page(page.previous_token)
+            backward = list(page) + backward
+        return walked, backward
+
+    def test_walk(self):
+        for qs, ordering, expected in (
+            (SimpleModel.objects.all(), 'pk', ('pk',)),
+            (SimpleModel.objects.all(), ('-name',), ('-name', '-pk')),
+            (SimpleModel.objects.filter(name__gt='object 1'),
+             ('name', '-pk'), ('name', '-pk')),
+            (SimpleModel.objects.values_list('name', 'pk'), ('name',),
+             ('name', 'pk')),
+        ):
+            objects = list(qs.order_by(*expected))
+            for late_lookup in (False, True):
+                if late_lookup and ordering == ('name',):
+                    # values
+                    continue
+                paginator = PerformantPaginator(qs, per_page=10,
+                                                ordering=ordering,
+                                                late_lookup=late_lookup,
+                                                compiled=True)
+                walked, backward = self.walk(paginator)
+                self.assertEquals(objects, walked)
+                self.assertEquals(objects[:len(backward)], backward)
+                # all compiled, none had to fall back
+                self.assertTrue(paginator._compiled)
+                self.assertTrue(all(paginator._compiled.values()))
+
+    def test_related(self):
+        simple = list(SimpleModel.objects.all()[:4])
+        RelatedModel.objects.bulk_create(
+            [RelatedModel(simple=simple[i % 4], number=i) for i in range(21)]
+        )
+        objects = list(RelatedModel.objects.select_related('simple')
+                       .order_by('-simple__name', 'number', 'pk'))
+        paginator = PerformantPaginator(RelatedModel.objects.all(),
+                                        per_page=4, compiled=True,
+                                        ordering=('-simple__name', 'number'))
+        walked, backward = self.walk(paginator)
+        self.assertEquals(objects, walked)
+        # the relationship came along
+        with self.assertNumQueries(0):
+            self.assertEquals([obj.simple.name for obj in objects],
+                              [obj.simple.name for obj in walked])
+
+    def test_datetime(self):
+        base = datetime(2003, 2, 3, 4, 5, 30)
+        TimedModel.objects.bulk_create(
+            [TimedModel(when_datetime=base + timedelta(hours=i),
+                        when_date=base + timedelta(days=i),
+                        when_time=(base + timedelta(seconds=i)).time())
+             for i in range(19)]
+        )
+        qs = TimedModel.objects.filter(when_datetime__year=2003)
+        objects = list(qs.order_by('-when_datetime'))
+        paginator = PerformantPaginator(qs, per_page=5, compiled=True,
+                                        ordering='-when_datetime')
+        self.assertEquals(objects, self.walk(paginator)[0])
+        self.assertEquals(objects[3:8], list(paginator.page_at(
+            objects[3].when_datetime)))
+        self.assertTrue(all(paginator._compiled.values()))
+
+    def test_having(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+        # the having's param follows the token's, and then one that's the
+        # same as the token's, so it'd be easy to mistake one for the other
+        for limit in (1000, objects[9].pk):
+            qs = SimpleModel.objects.annotate(n=Count('related_models')) \
+                .filter(n__lt=limit)
+            paginator = PerformantPaginator(qs, per_page=10, compiled=True)
+            walked, backward = self.walk(paginator)
+            self.assertEquals(objects, walked)
+            self.assertEquals(objects[:len(backward)], backward)
+        # there was no telling where the token's param was
+        self.assertFalse(all(paginator._compiled.values()))
+
+    def test_bind(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, compiled=True)
+        token = paginator.page().next_token
+        paginator.page(token)
+        compiled = [c for c in paginator._compiled.values() if c.preps][0]
+        self.assertTrue(compiled.bind([1]) is not None)
+        # values that the orm wouldn't put in the params the same way
+        self.assertEquals(None, compiled.bind([None]))
+
+    def test_single_query(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, compiled=True)
+        page = paginator.page()
+        page = paginator.page(page.next_token)
+        # compiled now, just the query
+        with self.assertNumQueries(1):
+            page = paginator.page(page.next_token)
+        self.assertEquals(list(SimpleModel.objects.order_by('pk')[20:30]),
+                          list(page))
+
+    def test_fall_back(self):
+        paginator = PerformantPaginator(SimpleModel.objects.none(),
+                                        compiled=True)
+        self.assertEquals([], list(paginator.page()))
+        self.assertEquals([False], list(paginator._compiled.values()))
+
+    def test_partitions(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=5, compiled=True)
+        paginator.page()
+        walked = []
+        for partition in paginator.partitions(3):
+            walked.extend(self.walk(partition)[0])
+        self.assertEquals(list(SimpleModel.objects.order_by('pk')), walked)
+
+    def test_snapshot(self):
+        for ordering in ('pk', ('-name',)):
+            paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                            per_page=10, ordering=ordering,
+                                            compiled=True, snapshot=True)
+            objects = list(SimpleModel.objects.order_by(
+                *paginator._orderings))
+            walked, backward = self.walk(paginator)
+            self.assertEquals(objects, walked)
+            self.assertEquals(objects[:len(backward)], backward)
+            self.assertTrue(all(paginator._compiled.values()))
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0:02d}'.format(i)) for i in range(25)]
+        )
+
+        self.grown = 0
+
+    def grow(self):
+        # rows past the end of any of the orderings we walk
+        self.grown += 1
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='z {0:03d}'.format(self.grown)),
+             SimpleModel(name='a {0:03d}'.format(1000 - self.grown))]
+        )
+
+    def test_walk(self):
+        for ordering in ('pk', '-pk', ('name',), ('-name',)):
+            paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                            per_page=10, ordering=ordering,
+                                            snapshot=True)
+            objects = list(SimpleModel.objects.order_by(
+                *paginator._orderings))
+            # the bound's an extra query, but only for the first page
+            with self.assertNumQueries(2):
+                page = paginator.page()
+            walked = list(page)
+            while page.has_next():
+                self.grow()
+                with self.assertNumQueries(1):
+                    page = paginator.page(page.next_token)
+                walked.extend(page)
+            # nothing that came along after we started
+            self.assertEquals(objects, walked)
+            last = (len(objects) - 1) // 10 * 10
+            self.assertEquals(objects[last - 10:last],
+                              list(paginator.page(page.previous_token)))
+
+    def test_without(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10)
+        page = paginator.page()
+        walked = list(page)
+        while page.has_next() and len(walked) < 100:
+            self.grow()
+            page = paginator.page(page.next_token)
+            walked.extend(page)
+        # chases the new rows
+        self.assertTrue(len(walked) > 25)
+
+    def test_page_at(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, ordering=('name',),
+                                        snapshot=True)
+        page = paginator.page_at('object 20')
+        self.assertEquals(5, len(page))
+        self.grow()
+        self.assertFalse(page.has_next())
+        # the walk back is bound as well
+        page = paginator.page(page.previous_token)
+        self.assertEquals(10, len(page))
+        self.assertEquals('object 19', page[-1].name)
+
+    def test_iter_batches(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        snapshot=True)
+        walked = []
+        for batch in paginator.iter_batches(7):
+            self.grow()
+            walked.extend(batch)
+        self.assertEquals(25, len(walked))
+
+        paginator = PerformantPaginator(SimpleModel.objects.none(),
+                                        snapshot=True)
+        self.assertEquals([], list(paginator.iter_objects()))
+
+    def test_invalid(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        snapshot=True)
+        for token in (Token([1], bound=[1, 2]), Token([1], bound=[]),
+                      Token([1], bound=['x'])):
+            with self.assertRaises(InvalidPage):
+                paginator.page(paginator.codec.encode(token))
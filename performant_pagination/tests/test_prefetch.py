@@ -0,0 +1,188 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.test import TestCase
+from multiprocessing.pool import ThreadPool
+from performant_pagination import prefetch
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.prefetch import Prefetcher
+from performant_pagination.tests.models import SimpleModel
+from performant_pagination.tokens import BinaryTokenCodec
+
+
+class _Result(object):
+
+    def __init__(self, func, args):
+        self.value = self.error = None
+        try:
+            self.value = func(*args)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        if self.error:
+            raise self.error
+        return self.value
+
+
+class _SyncPool(object):
+    # does its "background" work on the spot so that we can see exactly what
+    # happens when
+
+    def __init__(self):
+        self.submitted = []
+
+    def apply_async(self, func, args):
+        self.submitted.append(args)
+        return _Result(func, args)
+
+
+class TestPrefetcher(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i)) for i in range(53)]
+        )
+
+    def test_walk(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+        pool = _SyncPool()
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10,
+                                        prefetcher=Prefetcher(pool=pool))
+        # the first page, and the prefetch of the second
+        with self.assertNumQueries(2):
+            page = paginator.page()
+        walked = list(page)
+        # each page was waiting for us, all we do is prefetch the ones after
+        # them, 3-6
+        with self.assertNumQueries(4):
+            while page.has_next():
+                page = paginator.page(page.next_token)
+                walked.extend(page)
+        self.assertEquals(objects, walked)
+        self.assertEquals(5, len(pool.submitted))
+
+        # other pages are fetched as usual
+        with self.assertNumQueries(2):
+            page = paginator.page(page.previous_token)
+        self.assertEquals(objects[40:50], list(page))
+
+    def test_size(self):
+        pool = _SyncPool()
+        prefetcher = Prefetcher(size=2, pool=pool)
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, prefetcher=prefetcher)
+        tokens = [page.next_token for page in
+                  (paginator.page(), paginator.page(''))]
+        self.assertEquals(tokens[0], tokens[1])
+        # already pending, not submitted again
+        self.assertEquals(1, len(pool.submitted))
+
+        for page in list(paginator.iter_batches())[:3]:
+            prefetcher.submit(paginator, paginator._object_to_token(page[-1]))
+        self.assertEquals(2, len(prefetcher._pending))
+        # the oldest was dropped
+        self.assertEquals(None, prefetcher.take(paginator, tokens[0]))
+
+    def test_empty(self):
+        # take builds the key whether or not there's anything waiting
+        prefetcher = Prefetcher(pool=_SyncPool())
+        paginator = PerformantPaginator(SimpleModel.objects.filter(pk__in=[]),
+                                        per_page=10, prefetcher=prefetcher)
+        page = paginator.page()
+        self.assertEquals([], list(page))
+        self.assertFalse(page.has_next())
+
+    def test_shared(self):
+        pool = _SyncPool()
+        prefetcher = Prefetcher(pool=pool)
+        mine = PerformantPaginator(SimpleModel.objects.all(), per_page=10,
+                                   prefetcher=prefetcher)
+        theirs = PerformantPaginator(
+            SimpleModel.objects.filter(name__endswith='1'), per_page=10,
+            prefetcher=prefetcher)
+        token = mine.page().next_token
+        # the same token means something else to a different queryset, which
+        # mustn't be handed our prefetched page, it's fetched for real and
+        # there's nothing after it to prefetch
+        with self.assertNumQueries(1):
+            page = theirs.page(token)
+        self.assertTrue(all(o.name.endswith('1') for o in page))
+        # but ours is still there for us
+        with self.assertNumQueries(1):
+            mine.page(token)
+
+    def test_codecs(self):
+        prefetcher = Prefetcher(pool=_SyncPool())
+        mine = PerformantPaginator(SimpleModel.objects.all(), per_page=10,
+                                   codec=BinaryTokenCodec(secret='mine'),
+                                   prefetcher=prefetcher)
+        theirs = PerformantPaginator(SimpleModel.objects.all(), per_page=10,
+                                     codec=BinaryTokenCodec(secret='theirs'),
+                                     prefetcher=prefetcher)
+        token = mine.page().next_token
+        # a codec with another secret doesn't get our page for a token it
+        # wouldn't accept
+        with self.assertRaises(InvalidPage):
+            theirs.page(token)
+
+    def test_timeout(self):
+        prefetcher = Prefetcher(pool=_SyncPool(), timeout=10)
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, prefetcher=prefetcher)
+        token = paginator.page().next_token
+        now = prefetch.time()
+        prefetch.time = lambda: now + 11
+        try:
+            # never asked for in time, it's been thrown away
+            self.assertEquals(None, prefetcher.take(paginator, token))
+            self.assertEquals(0, len(prefetcher._pending))
+        finally:
+            prefetch.time = time
+
+    def test_errors(self):
+        prefetcher = Prefetcher(pool=_SyncPool())
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        prefetcher=prefetcher)
+        prefetcher.submit(paginator, 'garbage')
+        self.assertEquals(None, prefetcher.take(paginator, 'garbage'))
+        with self.assertRaises(InvalidPage):
+            paginator.page('garbage')
+
+    def test_threaded(self):
+        # sqlite's in-memory test database only exists for the connection
+        # that created it, so let the pool's thread share ours
+        connection = connections['default']
+        connection.allow_thread_sharing = True
+
+        def share():
+            connections['default'] = connection
+
+        pool = ThreadPool(1, initializer=share)
+        prefetcher = Prefetcher(pool=pool)
+        try:
+            objects = list(SimpleModel.objects.order_by('-pk'))
+            paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                            per_page=10, ordering='-pk',
+                                            prefetcher=prefetcher)
+            page = paginator.page()
+            walked = list(page)
+            while page.has_next():
+                page = paginator.page(page.next_token)
+                walked.extend(page)
+            self.assertEquals(objects, walked)
+        finally:
+            prefetcher.close()
+            pool.close()
+            pool.join()
+            connection.allow_thread_sharing = False
+
+
+# the real clock, to put back after travelling
+time = prefetch.time
@@ -0,0 +1,193 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.paginator import InvalidPage
+from django.test import TestCase
+from performant_pagination import pagination
+from performant_pagination.checkpoints import Checkpoints
+from performant_pagination.instrumentation import page_served
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.prefetch import Prefetcher
+from performant_pagination.sizing import AdaptivePageSize, row_bytes
+from performant_pagination.tests.models import SimpleModel
+from performant_pagination.tests.test_prefetch import _SyncPool
+from performant_pagination.tokens import Token
+
+
+class TestAdaptivePageSize(TestCase):
+
+    def test_sizes(self):
+        adaptive = AdaptivePageSize(target_time=1, min_size=10, max_size=100)
+        self.assertEquals([10, 20, 40, 80, 100], adaptive.sizes)
+        self.assertEquals([10, 10, 20, 20, 80, 100, 100],
+                          [adaptive.clamp(size) for size in
+                           (1, 10, 20, 39, 99, 100, 1000)])
+        self.assertEquals([7], AdaptivePageSize(target_time=1, min_size=7,
+                                                max_size=7).sizes)
+
+    def test_time(self):
+        adaptive = AdaptivePageSize(target_time=1, min_size=10, max_size=100)
+        rows = [None] * 20
+        # nothing to go on yet
+        self.assertEquals(20, adaptive.initial(25))
+        # fast, but can only double
+        self.assertEquals(40, adaptive.next_size(20, rows, 0.2))
+        # slow
+        self.assertEquals(10, adaptive.next_size(20, rows, 2))
+        # nothing to go on
+        self.assertEquals(20, adaptive.next_size(20, [], 2))
+        # first pages go by what's been seen
+        self.assertTrue(adaptive.initial(25) < 80)
+
+    def test_learn(self):
+        adaptive = AdaptivePageSize(target_time=1, min_size=10, max_size=100)
+        rows = [None] * 20
+        # the size's still worked out, but the averages are left alone
+        self.assertEquals(10, adaptive.next_size(20, rows, 2, learn=False))
+        self.assertEquals(20, adaptive.initial(25))
+        adaptive.next_size(20, rows, 2)
+        self.assertEquals(10, adaptive.initial(25))
+
+    def test_bytes(self):
+        adaptive = AdaptivePageSize(target_bytes=1000, min_size=1,
+                                    max_size=128, measure=lambda row: row)
+        self.assertEquals(16, adaptive.next_size(32, [50, 50, 60, 40], 1))
+        self.assertEquals(128, adaptive.next_size(64, [1, 2, 3], 1))
+        # the smaller of the two
+        adaptive.target_time = 0.1
+        self.assertEquals(8, adaptive.next_size(32, [1] * 10, 0.1))
+
+    def test_row_bytes(self):
+        self.assertEquals(3, row_bytes({'a': 1, 'b': 'xy'}))
+        self.assertEquals(3, row_bytes((1, 'xy')))
+        self.assertEquals(5, row_bytes(12345))
+        obj = SimpleModel(id=42, name='hello')
+        self.assertEquals(7, row_bytes(obj))
+
+    def test_invalid(self):
+        for kwargs in ({}, {'target_time': 1, 'min_size': 0},
+                       {'target_bytes': 1, 'min_size': 10, 'max_size': 5}):
+            with self.assertRaises(ValueError):
+                AdaptivePageSize(**kwargs)
+
+
+class TestAdaptivePagination(TestCase):
+
+    def setUp(self):
+        # small rows and then big ones
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='x') for _ in range(30)] +
+            [SimpleModel(name='x' * 20) for _ in range(40)]
+        )
+
+    def adaptive(self):
+        return AdaptivePageSize(target_bytes=100, min_size=2, max_size=64,
+                                measure=lambda obj: len(obj.name))
+
+    def walk(self, paginator):
+        page = paginator.page()
+        pages = [list(page)]
+        while page.has_next():
+            page = paginator.page(page.next_token)
+            pages.append(list(page))
+        backward = []
+        while page.has_previous():
+            page = paginator.page(page.previous_token)
+            backward = list(page) + backward
+        return pages, backward
+
+    def test_walk(self):
+        objects = list(SimpleModel.objects.order_by('pk'))
+        for compiled in (False, True):
+            for late_lookup in (False, True):
+                paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                                per_page=4,
+                                                adaptive=self.adaptive(),
+                                                compiled=compiled,
+                                                late_lookup=late_lookup)
+                pages, backward = self.walk(paginator)
+                # growing through the small rows, cut back when they're big
+                self.assertEquals([4, 8, 16, 32, 4, 4, 2],
+                                  [len(page) for page in pages])
+                self.assertEquals(objects,
+                                  [obj for page in pages for obj in page])
+                self.assertEquals(objects[:len(backward)], backward)
+
+    def test_token(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=4, adaptive=self.adaptive())
+        page = paginator.page()
+        self.assertEquals(8, paginator.codec.decode(page.next_token).size)
+        self.assertEquals(8, len(paginator.page(page.next_token)))
+        # sizes are kept to the adaptive's, whatever the token says
+        for size, expected in ((1000, 64), (3, 2)):
+            token = paginator.codec.encode(Token([0], size=size))
+            self.assertEquals(expected, len(paginator.page(token)))
+        with self.assertRaises(InvalidPage):
+            paginator.page(paginator.codec.encode(Token([0], size=0)))
+
+        # a fixed per_page ignores them
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=4)
+        page = paginator.page(paginator.codec.encode(Token([0], size=10)))
+        self.assertEquals(4, len(page))
+        self.assertEquals(None, paginator.codec.decode(page.next_token).size)
+
+    def test_checkpoints(self):
+        with self.assertRaises(ValueError):
+            PerformantPaginator(SimpleModel.objects.all(),
+                                adaptive=self.adaptive(),
+                                checkpoints=Checkpoints())
+
+    def test_query_time(self):
+        # measuring takes a second a row, the query no time at all
+        now = [0]
+
+        def measure(obj):
+            now[0] += 1
+            return len(obj.name)
+
+        records = []
+
+        def receive(sender, record, **kwargs):
+            records.append(record)
+
+        adaptive = AdaptivePageSize(target_bytes=100, min_size=2,
+                                    max_size=64, measure=measure)
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=4, adaptive=adaptive)
+        pagination.time = lambda: now[0]
+        page_served.connect(receive)
+        try:
+            paginator.page()
+        finally:
+            pagination.time = time
+            page_served.disconnect(receive)
+        self.assertEquals(0, records[0].query_time)
+        self.assertEquals(4, records[0].total_time)
+
+    def test_prefetched(self):
+        adaptive = self.adaptive()
+        learnt = []
+        next_size = adaptive.next_size
+
+        def recording(size, rows, elapsed, learn=True):
+            learnt.append(learn)
+            return next_size(size, rows, elapsed, learn)
+
+        adaptive.next_size = recording
+        prefetcher = Prefetcher(pool=_SyncPool())
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=4, adaptive=adaptive,
+                                        prefetcher=prefetcher)
+        page = paginator.page()
+        paginator.page(page.next_token)
+        # the pages served are learnt from, not those prefetched
+        self.assertEquals([True, False, False], learnt)
+
+
+# the real clock, to put back after travelling
+time = pagination.time
@@ -0,0 +1,212 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from base64 import urlsafe_b64encode
+from datetime import date, datetime, time
+from decimal import Decimal
+from django.core.paginator import InvalidPage
+from django.test import TestCase
+from django.utils import timezone
+from performant_pagination.pagination import PerformantPaginator
+from performant_pagination.tests.models import SimpleModel, TimedModel
+from performant_pagination.tokens import Base64TokenCodec, \
+    BinaryTokenCodec, Token, _write_bytes, _write_varint, _write_zigzag
+from uuid import UUID
+import re
+
+
+class TestBase64TokenCodec(TestCase):
+
+    def test_round_trip(self):
+        codec = Base64TokenCodec()
+        # values come back as strings
+        for token, expected, encoded in (
+            (Token([42]), ['42'], 'NDI='),
+            (Token([42], True), ['42'], '~NDI='),
+            (Token([42], inclusive=True), ['42'], '-NDI='),
+            (Token([42], True, True), ['42'], '~-NDI='),
+            (Token(['a', 1]), ['a', '1'], 'YQ==.MQ=='),
+            (Token([datetime(2013, 10, 27, 8, 44)]),
+             ['2013-10-27T08:44:00'], 'MjAxMy0xMC0yN1QwODo0NDowMA=='),
+            (Token(['\xe9t\xe9']), ['\xe9t\xe9'], 'w6l0w6k='),
+        ):
+            self.assertEquals(encoded, codec.encode(token))
+            decoded = codec.decode(encoded)
+            self.assertEquals(expected, decoded.values)
+            self.assertEquals(token.backward, decoded.backward)
+            self.assertEquals(token.inclusive, decoded.inclusive)
+            self.assertEquals(None, decoded.bound)
+
+    def test_bound(self):
+        codec = Base64TokenCodec()
+        encoded = codec.encode(Token(['a', 1], True, bound=['z', 9]))
+        self.assertEquals('~YQ==.MQ==!eg==.OQ==', encoded)
+        self.assertEquals(Token(['a', '1'], True, bound=['z', '9']),
+                          codec.decode(encoded))
+
+    def test_size(self):
+        codec = Base64TokenCodec()
+        for token, encoded in (
+            (Token([42], size=10), 'NDI=*10'),
+            (Token([42], True, bound=[43], size=10), '~NDI=!NDM=*10'),
+        ):
+            self.assertEquals(encoded, codec.encode(token))
+        decoded = codec.decode('~NDI=!NDM=*10')
+        self.assertEquals(10, decoded.size)
+        self.assertEquals(['43'], decoded.bound)
+        with self.assertRaises(InvalidPage):
+            codec.decode('NDI=*ten')
+
+    def test_invalid(self):
+        codec = Base64TokenCodec()
+        for encoded in (None, 42, 'a', 'NDI=.a'):
+            with self.assertRaises(InvalidPage):
+                codec.decode(encoded)
+
+
+class TestBinaryTokenCodec(TestCase):
+
+    values = [None, True, False, 0, 1, -1, 2 ** 70, -2 ** 70,
+              datetime(2013, 10, 27, 8, 44, 0, 123456),
+              datetime(1903, 1, 2, 3, 4, 5),
+              timezone.make_aware(datetime(2013, 10, 27, 8, 44),
+                                  timezone.utc),
+              date(2013, 10, 27), date(1903, 1, 2),
+              time(8, 44, 3, 12), time(0),
+              UUID('12345678-1234-5678-1234-567812345678'),
+              Decimal('-12.345'), 1.5, '', 'hello', '\xe9t\xe9']
+
+    def test_round_trip(self):
+        for codec in (BinaryTokenCodec(), BinaryTokenCodec(secret='s3cr3t')):
+            for backward in (False, True):
+                for inclusive in (False, True):
+                    for bound, size in ((None, None), ([], 1),
+                                        (self.values[::-1], None),
+                                        (self.values[::-1], 1000)):
+                        token = Token(self.values, backward, inclusive,
+                                      bound, size)
+                        encoded = codec.encode(token)
+                        # url safe, no padding
+                        self.assertTrue(re.match(r'^[\w-]+$', encoded))
+                        self.assertEquals(token, codec.decode(encoded))
+
+            for value in self.values:
+                token = Token([value])
+                decoded = codec.decode(codec.encode(token))
+                self.assertEquals(token, decoded)
+                self.assertEquals(type(value), type(decoded.values[0]))
+
+    def test_compact(self):
+        when = datetime(2013, 10, 27, 8, 44)
+        binary = BinaryTokenCodec().encode(Token([when, 123456]))
+        text = Base64TokenCodec().encode(Token([when, 123456]))
+        self.assertEquals(22, len(binary))
+        self.assertEquals(37, len(text))
+
+    def test_invalid(self):
+        codec = BinaryTokenCodec()
+        valid = codec.encode(Token([42, 'x']))
+        for encoded in (None, 42, '', 'a', '!!!!', valid[:-1], valid + 'AA',
+                        # unknown value type
+                        'AQABYw'):
+            with self.assertRaises(InvalidPage):
+                codec.decode(encoded)
+
+        # values that are well formed but can't be made in to python ones
+        def payload(kind, write, value):
+            buf = bytearray((codec.VERSION, 0, 1, kind))
+            write(buf, value)
+            return urlsafe_b64encode(bytes(buf)).decode('ascii')
+
+        for encoded in (payload(codec.DECIMAL, _write_bytes, b'abc'),
+                        payload(codec.DATETIME, _write_zigzag, 2 ** 80),
+                        payload(codec.DATE, _write_zigzag, -2 ** 40),
+                        payload(codec.TIME, _write_varint, 2 ** 80)):
+            with self.assertRaises(InvalidPage):
+                codec.decode(encoded)
+
+        # a different version is stale
+        codec.VERSION = 2
+        with self.assertRaises(InvalidPage):
+            codec.decode(valid)
+
+    def test_signed(self):
+        codec = BinaryTokenCodec(secret='s3cr3t')
+        encoded = codec.encode(Token([42]))
+        self.assertEquals([42], codec.decode(encoded).values)
+        # unsigned, or signed with something else, are rejected
+        for other in (BinaryTokenCodec(), BinaryTokenCodec(secret='other')):
+            with self.assertRaises(InvalidPage):
+                codec.decode(other.encode(Token([42])))
+        # as is one that's been tampered with
+        tampered = BinaryTokenCodec().encode(Token([43])) + encoded[-11:]
+        with self.assertRaises(InvalidPage):
+            codec.decode(tampered)
+
+
+class TestPaginatorCodec(TestCase):
+
+    def setUp(self):
+        SimpleModel.objects.bulk_create(
+            [SimpleModel(name='object {0}'.format(i % 7)) for i in range(53)]
+        )
+
+    def test_walk(self):
+        objects = list(SimpleModel.objects.order_by('-name', '-pk'))
+
+        codec = BinaryTokenCodec(secret='s3cr3t')
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        per_page=10, ordering=('-name',),
+                                        codec=codec)
+        page = paginator.page()
+        self.assertEquals(Token([objects[9].name, objects[9].pk]),
+                          codec.decode(page.next_token))
+        walked = list(page)
+        while page.has_next():
+            page = paginator.page(page.next_token)
+            walked.extend(page)
+        self.assertEquals(objects, walked)
+
+        # and back
+        page = paginator.page(page.previous_token)
+        self.assertEquals(objects[40:50], list(page))
+        self.assertTrue(codec.decode(page.previous_token).backward)
+
+        # forged tokens are rejected without a query
+        forged = BinaryTokenCodec().encode(Token(['object 3', 1]))
+        with self.assertNumQueries(0):
+            with self.assertRaises(InvalidPage):
+                paginator.page(forged)
+
+        # as are those with the wrong number of values, a prefix of the key
+        # is fine
+        for values in ([], ['object 3', 1, 2]):
+            with self.assertRaises(InvalidPage):
+                paginator.page(codec.encode(Token(values)))
+        self.assertEquals(objects[29:39], list(paginator.page(
+            codec.encode(Token(['object 3'])))))
+
+    def test_datetime(self):
+        when = datetime(2007, 10, 27, 8, 44, 11)
+        TimedModel.objects.create(when_datetime=when, when_date=when,
+                                  when_time=when)
+        paginator = PerformantPaginator(TimedModel.objects.all(),
+                                        ordering='when_datetime',
+                                        codec=BinaryTokenCodec())
+        token = paginator.codec.encode(Token([when]))
+        self.assertEquals(when, paginator._decode_token(token).values[0])
+        self.assertFalse(when in [o.when_datetime
+                                  for o in paginator.page(token)])
+
+    def test_invalid_value(self):
+        paginator = PerformantPaginator(SimpleModel.objects.all())
+        with self.assertRaises(InvalidPage):
+            paginator.page(Base64TokenCodec().encode(Token(['nope'])))
+        # binary tokens can carry values that to_python chokes on
+        paginator = PerformantPaginator(SimpleModel.objects.all(),
+                                        codec=BinaryTokenCodec())
+        with self.assertRaises(InvalidPage):
+            paginator.page(paginator.codec.encode(Token([float('inf')])))
@@ -0,0 +1,340 @@
+#
+#
+#
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+from base64 import b64decode, b64encode, urlsafe_b64decode, \
+    urlsafe_b64encode
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from django.core.paginator import InvalidPage
+from django.utils import six, timezone
+from hashlib import sha256
+from uuid import UUID
+import hmac
+import struct
+
+
+class Token(object):
+    '''A decoded token, the values of the key it points at, which way it
+    pages from them, whether the page includes them, the key, if any, that
+    paging stops at, and the size, if any, of the page.
+
+    There may be fewer values than fields in the key, a prefix of it, when the
+    token was made from a value rather than an object.'''
+
+    def __init__(self, values, backward=False, inclusive=False, bound=None,
+                 size=None):
+        self.values = list(values)
+        self.backward = backward
+        self.inclusive = inclusive
+        self.bound = None if bound is None else list(bound)
+        self.size = size
+
+    def __repr__(self):
+        return '<Token (%s, %s, %s, %s, %s)>' % (self.values, self.backward,
+                                                 self.inclusive, self.bound,
+                                                 self.size)
+
+    def __eq__(self, other):
+        return isinstance(other, Token) and self.values == other.values and \
+            self.backward == other.backward and \
+            self.inclusive == other.inclusive and \
+            self.bound == other.bound and self.size == other.size
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class Base64TokenCodec(object):
+    '''The original token format, each value of the key is stringified and
+    base64 encoded, with multiple values joined by '.', backward tokens
+    prefixed by '~', inclusive ones by '-', the bound, if any, following a
+    '!', and the size, if any, a '*', none of which are part of the base64
+    alphabet.
+
+    Values come back as strings and rely on the fields' to_python to convert
+    them.'''
+
+    BACKWARD = '~'
+    INCLUSIVE = '-'
+    BOUND = '!'
+    SIZE = '*'
+
+    def _encode_values(self, values):
+        pieces = []
+        for value in values:
+            # stringify the way fields' value_to_string would
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            value = six.text_type(value).encode('utf-8')
+            pieces.append(b64encode(value).decode('ascii'))
+        return '.'.join(pieces)
+
+    def _decode_values(self, encoded):
+        return [b64decode(piece).decode('utf-8')
+                for piece in encoded.split('.')]
+
+    def encode(self, token):
+        encoded = self._encode_values(token.values)
+        if token.bound is not None:
+            encoded += self.BOUND + self._encode_values(token.bound)
+        if token.size is not None:
+            encoded += self.SIZE + six.text_type(token.size)
+        if token.inclusive:
+            encoded = self.INCLUSIVE + encoded
+        return self.BACKWARD + encoded if token.backward else encoded
+
+    def decode(self, encoded):
+        if not isinstance(encoded, six.string_types):
+            raise InvalidPage('Page token is invalid')
+        backward = encoded.startswith(self.BACKWARD)
+        if backward:
+            encoded = encoded[len(self.BACKWARD):]
+        inclusive = encoded.startswith(self.INCLUSIVE)
+        if inclusive:
+            encoded = encoded[len(self.INCLUSIVE):]
+        encoded, sized, size = encoded.partition(self.SIZE)
+        encoded, bounded, encoded_bound = encoded.partition(self.BOUND)
+        try:
+            size = int(size) if sized else None
+            values = self._decode_values(encoded)
+            bound = None
+            if bounded:
+                bound = self._decode_values(encoded_bound) \
+                    if encoded_bound else []
+        except (TypeError, ValueError):
+            raise InvalidPage('Page token is invalid')
+        return Token(values, backward, inclusive, bound, size)
+
+
+def _write_varint(buf, n):
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            buf.append(byte | 0x80)
+        else:
+            buf.append(byte)
+            return
+
+
+def _write_zigzag(buf, n):
+    _write_varint(buf, n * 2 if n >= 0 else -n * 2 - 1)
+
+
+def _write_bytes(buf, data):
+    _write_varint(buf, len(data))
+    buf.extend(data)
+
+
+class _Reader(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def byte(self):
+        byte = self.data[self.offset]
+        self.offset += 1
+        return byte
+
+    def bytes(self, n):
+        if self.offset + n > len(self.data):
+            raise IndexError('ran out of data')
+        data = self.data[self.offset:self.offset + n]
+        self.offset += n
+        return bytes(data)
+
+    def varint(self):
+        n = shift = 0
+        while True:
+            byte = self.byte()
+            n |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return n
+            shift += 7
+
+    def zigzag(self):
+        n = self.varint()
+        return -((n + 1) >> 1) if n & 1 else n >> 1
+
+    def text(self):
+        return self.bytes(self.varint()).decode('utf-8')
+
+
+class BinaryTokenCodec(object):
+    '''A compact binary token format. Values are packed according to their
+    type, ints as varints, datetimes as microseconds since the epoch, UUIDs as
+    their 16 bytes, strings length-prefixed, etc., behind a version and flags
+    byte and then URL-safe base64 encoded without padding. Values come back
+    typed, no string parsing required.
+
+    If secret is provided tokens are signed with a truncated HMAC-SHA256,
+    digest_size bytes of it, and anything forged or tampered with will be
+    rejected before it gets anywhere near the database. Tokens from a
+    different VERSION of the format are rejected as stale.'''
+
+    VERSION = 1
+
+    BACKWARD = 0x01
+    INCLUSIVE = 0x02
+    BOUNDED = 0x04
+    SIZED = 0x08
+
+    NONE = 0
+    INT = 1
+    TEXT = 2
+    DATETIME = 3
+    AWARE_DATETIME = 4
+    DATE = 5
+    TIME = 6
+    UUID = 7
+    DECIMAL = 8
+    FLOAT = 9
+    TRUE = 10
+    FALSE = 11
+
+    EPOCH = datetime(1970, 1, 1)
+    EPOCH_DATE = EPOCH.date()
+
+    def __init__(self, secret=None, digest_size=8):
+        if isinstance(secret, six.text_type):
+            secret = secret.encode('utf-8')
+        self.secret = secret
+        self.digest_size = digest_size
+
+    def _digest(self, data):
+        return hmac.new(self.secret, data, sha256) \
+            .digest()[:self.digest_size]
+
+    def _micros(self, delta):
+        return (delta.days * 86400 + delta.seconds) * 1000000 + \
+            delta.microseconds
+
+    def _write_value(self, buf, value):
+        # order matters, bool is an int and datetime a date
+        if value is None:
+            buf.append(self.NONE)
+        elif value is True:
+            buf.append(self.TRUE)
+        elif value is False:
+            buf.append(self.FALSE)
+        elif isinstance(value, six.integer_types):
+            buf.append(self.INT)
+            _write_zigzag(buf, value)
+        elif isinstance(value, datetime):
+            if timezone.is_aware(value):
+                buf.append(self.AWARE_DATETIME)
+                value = timezone.make_naive(value, timezone.utc)
+            else:
+                buf.append(self.DATETIME)
+            _write_zigzag(buf, self._micros(value - self.EPOCH))
+        elif isinstance(value, date):
+            buf.append(self.DATE)
+            _write_zigzag(buf, (value - self.EPOCH_DATE).days)
+        elif isinstance(value, time):
+            buf.append(self.TIME)
+            _write_varint(buf, self._micros(timedelta(
+                hours=value.hour, minutes=value.minute, seconds=value.second,
+                microseconds=value.microsecond)))
+        elif isinstance(value, UUID):
+            buf.append(self.UUID)
+            buf.extend(value.bytes)
+        elif isinstance(value, Decimal):
+            buf.append(self.DECIMAL)
+            _write_bytes(buf, six.text_type(value).encode('utf-8'))
+        elif isinstance(value, float):
+            buf.append(self.FLOAT)
+            buf.extend(struct.pack('>d', value))
+        else:
+            # anything else goes as text and it's up to the field's
+            # to_python to sort it out
+            buf.append(self.TEXT)
+            _write_bytes(buf, six.text_type(value).encode('utf-8'))
+
+    def _read_value(self, reader):
+        kind = reader.byte()
+        if kind == self.NONE:
+            return None
+        elif kind == self.TRUE:
+            return True
+        elif kind == self.FALSE:
+            return False
+        elif kind == self.INT:
+            return reader.zigzag()
+        elif kind in (self.DATETIME, self.AWARE_DATETIME):
+            value = self.EPOCH + timedelta(microseconds=reader.zigzag())
+            if kind == self.AWARE_DATETIME:
+                value = timezone.make_aware(value, timezone.utc)
+            return value
+        elif kind == self.DATE:
+            return self.EPOCH_DATE + timedelta(days=reader.zigzag())
+        elif kind == self.TIME:
+            return (self.EPOCH + timedelta(microseconds=reader.varint())) \
+                .time()
+        elif kind == self.UUID:
+            return UUID(bytes=reader.bytes(16))
+        elif kind == self.DECIMAL:
+            return Decimal(reader.text())
+        elif kind == self.FLOAT:
+            return struct.unpack('>d', reader.bytes(8))[0]
+        elif kind == self.TEXT:
+            return reader.text()
+        raise ValueError('unknown value type {0}'.format(kind))
+
+    def encode(self, token):
+        flags = (self.BACKWARD if token.backward else 0) | \
+            (self.INCLUSIVE if token.inclusive else 0) | \
+            (self.BOUNDED if token.bound is not None else 0) | \
+            (self.SIZED if token.size is not None else 0)
+        buf = bytearray((self.VERSION, flags))
+        for values in (token.values, token.bound):
+            if values is None:
+                continue
+            _write_varint(buf, len(values))
+            for value in values:
+                self._write_value(buf, value)
+        if token.size is not None:
+            _write_varint(buf, token.size)
+        if self.secret:
+            buf.extend(self._digest(bytes(buf)))
+        return urlsafe_b64encode(bytes(buf)).decode('ascii').rstrip('=')
+
+    def decode(self, encoded):
+        if not isinstance(encoded, six.string_types):
+            raise InvalidPage('Page token is invalid')
+        try:
+            # put back the padding we stripped
+            data = urlsafe_b64decode((encoded + '=' * (-len(encoded) % 4))
+                                     .encode('ascii'))
+        except (TypeError, ValueError):
+            raise InvalidPage('Page token is invalid')
+
+        if self.secret:
+            data, digest = data[:-self.digest_size], \
+                data[-self.digest_size:]
+            if not hmac.compare_digest(self._digest(data), digest):
+                raise InvalidPage('Page token is invalid')
+
+        reader = _Reader(bytearray(data))
+        try:
+            if reader.byte() != self.VERSION:
+                raise InvalidPage('Page token is stale')
+            flags = reader.byte()
+            values = [self._read_value(reader)
+                      for _ in range(reader.varint())]
+            bound = None
+            if flags & self.BOUNDED:
+                bound = [self._read_value(reader)
+                         for _ in range(reader.varint())]
+            size = reader.varint() if flags & self.SIZED else None
+        except (ArithmeticError, IndexError, ValueError, struct.error):
+            # ArithmeticError covers bad decimals and dates out of range
+            raise InvalidPage('Page token is invalid')
+        if reader.offset != len(reader.data):
+            raise InvalidPage('Page token is invalid')
+
+        return Token(values, bool(flags & self.BACKWARD),
+                     bool(flags & self.INCLUSIVE), bound, size)
@@ -26,7 +26,8 @@ setup(
     description='',
     author='Ross McFarland',
     author_email='rwmcfa1@neces.com',
-    packages=('performant_pagination',),
+    packages=('performant_pagination', 'performant_pagination.management',
+              'performant_pagination.management.commands'),
     test_suite='performant_pagination.runtests.runtests.main',
     install_requires=[],
     classifiers=[